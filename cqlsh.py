@@ -40,6 +40,13 @@ import platform
 import warnings
 import csv
 import getpass
+import signal
+import multiprocessing
+import Queue
+import operator
+import itertools
+import shutil
+import tempfile
 
 
 readline = None
@@ -99,9 +106,22 @@ if os.path.isdir(cqlshlibdir):
 from cqlshlib import cqlhandling, cql3handling, pylexotron
 from cqlshlib.displaying import (RED, BLUE, ANSI_RESET, COLUMN_NAME_COLORS,
                                  FormattedValue, colorme)
-from cqlshlib.formatting import format_by_type
-from cqlshlib.util import trim_if_present
+from cqlshlib.formatting import (format_by_type, formatter_for_type, fixed_width_for_type,
+                                 TRUNCATION_MARKER)
+from cqlshlib.util import trim_if_present, prefetched, BufferedOutput
 from cqlshlib.tracing import print_trace_session
+from cqlshlib.copyutil import (ImportConverter, SynchronousImporter, PipelinedImporter,
+                               TokenAwareImporter, ImportErrorHandler, ImportCheckpoint,
+                               LiteralConverter, BinaryImportConverter, BinaryDumpReader,
+                               BinaryDumpWriter, SerializedValueDecoder, TokenPager,
+                               KeyContinuation, EncodedParamsQuery, CONVERSION_ERRORS,
+                               COMPRESSION_BUFFER_SIZE, column_type, part_filename,
+                               OffsetTrackingReader, RateLimiter, ProgressReporter,
+                               COMPRESSION_TYPES, ShardedOutput, RAW_ENCODINGS,
+                               raw_value_encoder, serialized_rows,
+                               group_into_batches, split_csv_file,
+                               compression_for, open_compressed)
+from cqlshlib.ring import TokenMap, token_function, split_token_range
 
 HISTORY_DIR = os.path.expanduser(os.path.join('~', '.cassandra'))
 CONFIG_FILE = os.path.join(HISTORY_DIR, 'cqlshrc')
@@ -121,12 +141,21 @@ if os.path.exists(OLD_HISTORY):
 
 DEFAULT_HOST = 'cassandra-a-1'
 DEFAULT_PORT = 9160
+DEFAULT_NATIVE_PORT = 9042
 DEFAULT_CQLVER = '3.1.1'
 DEFAULT_TRANSPORT_FACTORY = 'cqlshlib.tfactory.regular_transport_factory'
 
 DEFAULT_TIME_FORMAT = '%Y-%m-%d %H:%M:%S%z'
 DEFAULT_FLOAT_PRECISION = 5
 DEFAULT_SELECT_LIMIT = 10000
+DEFAULT_PAGE_SIZE = 100
+
+# old versions of Cassandra put a LIMIT of 10000 on queries without one, so
+# queries meant to get every row are given this one
+UNLIMITED_SELECT_LIMIT = 99999999
+
+# how many rows of a result to size its table's columns by
+WIDTH_SAMPLE_ROWS = 100
 
 if readline is not None and readline.__doc__ is not None and 'libedit' in readline.__doc__:
     DEFAULT_COMPLETEKEY = '\t'
@@ -183,6 +212,9 @@ my_commands_ending_with_newline = (
     'debug',
     'tracing',
     'expand',
+    'paging',
+    'more',
+    'maxcolwidth',
     'exit',
     'quit'
 )
@@ -209,6 +241,9 @@ cqlsh_extra_syntax_rules = r'''
                    | <helpCommand>
                    | <tracingCommand>
                    | <expandCommand>
+                   | <pagingCommand>
+                   | <moreCommand>
+                   | <maxColWidthCommand>
                    | <exitCommand>
                    ;
 
@@ -249,6 +284,9 @@ cqlsh_extra_syntax_rules = r'''
                          ( dir="FROM" ( fname=<stringLiteral> | "STDIN" )
                          | dir="TO"   ( fname=<stringLiteral> | "STDOUT" ) )
                          ( "WITH" <copyOption> ( "AND" <copyOption> )* )?
+                | "COPY" "(" query=<selectStatement> ")"
+                         dir="TO" ( fname=<stringLiteral> | "STDOUT" )
+                         ( "WITH" <copyOption> ( "AND" <copyOption> )* )?
                 ;
 
 <copyOption> ::= [optnames]=<identifier> "=" [optvals]=<copyOptionVal>
@@ -256,6 +294,8 @@ cqlsh_extra_syntax_rules = r'''
 
 <copyOptionVal> ::= <identifier>
                   | <stringLiteral>
+                  | <float>
+                  | <integer>
                   ;
 
 # avoiding just "DEBUG" so that this rule doesn't get treated as a terminal
@@ -271,6 +311,15 @@ cqlsh_extra_syntax_rules = r'''
 <expandCommand> ::= "EXPAND" ( switch=( "ON" | "OFF" ) )?
                    ;
 
+<pagingCommand> ::= "PAGING" ( switch="ON" ( size=<wholenumber> )? | switch="OFF" )?
+                  ;
+
+<moreCommand> ::= "MORE" ( size=<wholenumber> )?
+                ;
+
+<maxColWidthCommand> ::= "MAXCOLWIDTH" ( width=<wholenumber> | switch="OFF" )?
+                       ;
+
 <exitCommand> ::= "exit" | "quit"
                 ;
 
@@ -323,23 +372,65 @@ def complete_copy_column_names(ctxt, cqlsh):
         return [colnames[0]]
     return set(colnames[1:]) - set(existcols)
 
-COPY_OPTIONS = ('DELIMITER', 'QUOTE', 'ESCAPE', 'HEADER', 'ENCODING', 'NULL')
+COPY_OPTIONS = ('DELIMITER', 'QUOTE', 'ESCAPE', 'HEADER', 'ENCODING', 'NULL', 'COMPRESSION',
+                'FORMAT', 'NUMPROCESSES')
+COPY_FROM_OPTIONS = ('PREPAREDSTATEMENTS', 'MAXINFLIGHT', 'NATIVEPORT',
+                     'MAXBATCHSIZE', 'TOKENAWARE', 'CHECKPOINT', 'RESUME', 'MAXERRORS',
+                     'ERRFILE', 'MAXATTEMPTS', 'INGESTRATE', 'ADAPTIVE')
+COPY_TO_OPTIONS = ('ENCODING', 'PAGESIZE', 'CONCATENATE', 'MAXOUTPUTSIZE', 'MAXOUTPUTBYTES',
+                   'MODE', 'RAWENCODING')
 
 @cqlsh_syntax_completer('copyOption', 'optnames')
 def complete_copy_options(ctxt, cqlsh):
     optnames = map(str.upper, ctxt.get_binding('optnames', ()))
     direction = ctxt.get_binding('dir').upper()
-    opts = set(COPY_OPTIONS) - set(optnames)
     if direction == 'FROM':
-        opts -= ('ENCODING',)
-    return opts
+        opts = set(COPY_OPTIONS + COPY_FROM_OPTIONS) - set(COPY_TO_OPTIONS)
+    else:
+        opts = set(COPY_OPTIONS + COPY_TO_OPTIONS)
+        if ctxt.get_binding('query') is not None:
+            opts -= set(('FORMAT', 'NUMPROCESSES', 'CONCATENATE'))
+    return opts - set(optnames)
 
 @cqlsh_syntax_completer('copyOption', 'optvals')
 def complete_copy_opt_values(ctxt, cqlsh):
     optnames = ctxt.get_binding('optnames', ())
     lastopt = optnames[-1].lower()
-    if lastopt == 'header':
+    if lastopt in ('header', 'preparedstatements', 'tokenaware', 'resume', 'adaptive',
+                   'concatenate'):
         return ['true', 'false']
+    if lastopt == 'compression':
+        return ['auto', 'none'] + list(COMPRESSION_TYPES)
+    if lastopt == 'format':
+        return ['csv', 'binary']
+    if lastopt == 'mode':
+        return ['text', 'raw']
+    if lastopt == 'rawencoding':
+        return list(RAW_ENCODINGS)
+    if lastopt == 'numprocesses':
+        return [cqlhandling.Hint('<number_of_worker_processes>')]
+    if lastopt == 'maxinflight':
+        return [cqlhandling.Hint('<max_outstanding_requests>')]
+    if lastopt == 'nativeport':
+        return [cqlhandling.Hint('<port>')]
+    if lastopt == 'maxbatchsize':
+        return [cqlhandling.Hint('<max_rows_per_batch>')]
+    if lastopt == 'checkpoint':
+        return [cqlhandling.Hint('<checkpoint_file>')]
+    if lastopt == 'maxerrors':
+        return [cqlhandling.Hint('<max_rejected_rows_or_-1>')]
+    if lastopt == 'errfile':
+        return [cqlhandling.Hint('<reject_file>')]
+    if lastopt == 'maxattempts':
+        return [cqlhandling.Hint('<max_tries_per_row>')]
+    if lastopt == 'pagesize':
+        return [cqlhandling.Hint('<rows_per_page>')]
+    if lastopt == 'ingestrate':
+        return [cqlhandling.Hint('<rows_per_second>')]
+    if lastopt == 'maxoutputsize':
+        return [cqlhandling.Hint('<max_rows_per_file>')]
+    if lastopt == 'maxoutputbytes':
+        return [cqlhandling.Hint('<max_bytes_per_file>')]
     return [cqlhandling.Hint('<single_character_string>')]
 
 class NoKeyspaceError(Exception):
@@ -354,6 +445,9 @@ class ColumnFamilyNotFound(Exception):
 class VersionNotSupported(Exception):
     pass
 
+class StatementFailed(Exception):
+    pass
+
 class DecodeError(Exception):
     verb = 'decode'
 
@@ -389,7 +483,7 @@ def full_cql_version(ver):
     return ver, vertuple
 
 def format_value(val, typeclass, output_encoding, addcolor=False, time_format=None,
-                 float_precision=None, colormap=None, nullval=None):
+                 float_precision=None, colormap=None, nullval=None, max_width=None):
     if isinstance(val, DecodeError):
         if addcolor:
             return colorme(repr(val.thebytes), colormap, 'error')
@@ -399,7 +493,25 @@ def format_value(val, typeclass, output_encoding, addcolor=False, time_format=No
         typeclass = lookup_casstype(typeclass)
     return format_by_type(typeclass, val, output_encoding, colormap=colormap,
                           addcolor=addcolor, nullval=nullval, time_format=time_format,
-                          float_precision=float_precision)
+                          float_precision=float_precision, max_width=max_width)
+
+def value_formatter(typeclass, output_encoding, addcolor=False, time_format=None,
+                    float_precision=None, colormap=None, nullval=None):
+    """
+    Return a function of one value that formats it just like format_value
+    would with the rest of these arguments.
+    """
+    if not issubclass(typeclass, CassandraType):
+        typeclass = lookup_casstype(typeclass)
+    format_one = formatter_for_type(typeclass, output_encoding, colormap=colormap,
+                                    addcolor=addcolor, nullval=nullval,
+                                    time_format=time_format, float_precision=float_precision)
+    def format_value_or_error(val):
+        if isinstance(val, DecodeError):
+            return format_value(val, typeclass, output_encoding, addcolor=addcolor,
+                                colormap=colormap)
+        return format_one(val)
+    return format_value_or_error
 
 def show_warning_without_quoting_line(message, category, filename, lineno, file=None, line=None):
     if file is None:
@@ -443,6 +555,10 @@ class Shell(cmd.Cmd):
     shunted_query_out = None
     csv_dialect_defaults = dict(delimiter=',', doublequote=False,
                                 escapechar='\\', quotechar='"')
+    import_chunk_size = 1000
+    import_split_size = 4 * 1024 * 1024
+    export_page_size = 1000
+    export_tasks_per_process = 4
 
     def __init__(self, hostname, port, transport_factory, color=False,
                  username=None, password=None, encoding=None, stdin=None, tty=True,
@@ -451,7 +567,7 @@ class Shell(cmd.Cmd):
                  tracing_enabled=False, expand_enabled=False,
                  display_time_format=DEFAULT_TIME_FORMAT,
                  display_float_precision=DEFAULT_FLOAT_PRECISION,
-                 single_statement=None):
+                 max_col_width=None, single_statement=None):
         cmd.Cmd.__init__(self, completekey=completekey)
         self.hostname = hostname
         self.port = port
@@ -465,6 +581,9 @@ class Shell(cmd.Cmd):
         self.keyspace = keyspace
         self.tracing_enabled = tracing_enabled
         self.expand_enabled = expand_enabled
+        self.paging_enabled = False
+        self.page_size = DEFAULT_PAGE_SIZE
+        self.continuation = None
         if use_conn is not None:
             self.conn = use_conn
         else:
@@ -486,6 +605,7 @@ class Shell(cmd.Cmd):
         self.color = color
         self.display_time_format = display_time_format
         self.display_float_precision = display_float_precision
+        self.max_col_width = max_col_width
         if encoding is None:
             encoding = locale.getpreferredencoding()
         self.encoding = encoding
@@ -506,7 +626,7 @@ class Shell(cmd.Cmd):
         else:
             self.show_line_nums = True
         self.stdin = stdin
-        self.query_out = sys.stdout
+        self.query_out = BufferedOutput(sys.stdout)
         self.empty_lines = 0
         self.statement_error = False
         self.single_statement = single_statement
@@ -528,6 +648,7 @@ class Shell(cmd.Cmd):
     def myformat_value(self, val, casstype, **kwargs):
         if isinstance(val, DecodeError):
             self.decoding_errors.append(val)
+        kwargs.setdefault('max_width', self.max_col_width)
         try:
             return format_value(val, casstype, self.output_codec.name,
                                 addcolor=self.color, time_format=self.display_time_format,
@@ -538,7 +659,7 @@ class Shell(cmd.Cmd):
             return format_value(err, None, self.output_codec.name, addcolor=self.color)
 
     def myformat_colname(self, name, nametype):
-        return self.myformat_value(name, nametype, colormap=COLUMN_NAME_COLORS)
+        return self.myformat_value(name, nametype, colormap=COLUMN_NAME_COLORS, max_width=None)
 
     # cql/cursor.py:Cursor.decode_row() function, modified to not turn '' into None.
     def decode_row(self, cursor, row):
@@ -638,10 +759,12 @@ class Shell(cmd.Cmd):
     def get_thrift_version(self):
         return self.make_hacktastic_thrift_call('describe_version')
 
-    def get_ring(self):
-        if self.current_keyspace is None or self.current_keyspace == 'system':
+    def get_ring(self, ksname=None):
+        if ksname is None:
+            ksname = self.current_keyspace
+        if ksname is None or ksname == 'system':
             raise NoKeyspaceError("Ring view requires a current non-system keyspace")
-        return self.make_hacktastic_thrift_call('describe_ring', self.current_keyspace)
+        return self.make_hacktastic_thrift_call('describe_ring', ksname)
 
     def get_keyspace(self, ksname):
         try:
@@ -774,6 +897,7 @@ class Shell(cmd.Cmd):
                         line = self.single_statement
                         self.stop = True
                     else:
+                        self.flush_output()
                         line = self.get_input_line(self.prompt)
                     self.statement.write(line)
                     if self.onecmd(self.statement.getvalue()):
@@ -821,6 +945,7 @@ class Shell(cmd.Cmd):
                     traceback.print_exc()
                 else:
                     self.printerr(e)
+            self.flush_output()
         return True
 
     def handle_eof(self):
@@ -883,7 +1008,24 @@ class Shell(cmd.Cmd):
             ksname = self.cql_unprotect_name(ksname)
         cfname = self.cql_unprotect_name(parsed.get_binding('cfname'))
         statement = parsed.extract_orig()
+        self.continuation = None
+        if self.paging_enabled and not self.tracing_enabled:
+            limit = parsed.get_binding('limit')
+            if limit is not None:
+                limit = int(limit)
+            pager = self.prep_paged_select(parsed, ksname, cfname,
+                                           min(self.page_size, limit or self.page_size))
+            if pager is not None:
+                self.perform_paged_select(pager, limit)
+                return
         with_default_limit = parsed.get_binding('limit') is None
+        if with_default_limit and not self.tracing_enabled:
+            continuation = self.prep_select_continuation(parsed, ksname, cfname)
+            if continuation is not None:
+                if self.print_continued_select(continuation, DEFAULT_SELECT_LIMIT) \
+                        and not continuation.exhausted:
+                    self.continuation = continuation
+                return
         if with_default_limit:
             statement = "%s LIMIT %d;" % (statement[:-1], DEFAULT_SELECT_LIMIT)
         self.perform_statement(statement,
@@ -907,11 +1049,29 @@ class Shell(cmd.Cmd):
     def perform_statement_untraced(self, statement, decoder=None, with_default_limit=False):
         if not statement:
             return False
+        if not self.execute_with_retries(self.cursor.execute, statement, decoder=decoder):
+            return False
+
+        if statement[:6].lower() == 'select' or statement.lower().startswith("list"):
+            self.print_result(self.cursor, with_default_limit)
+        elif self.cursor.rowcount > 0:
+            # CAS INSERT/UPDATE
+            self.writeresult("")
+            self.print_static_result(self.cursor)
+        self.flush_output()
+        return True
+
+    def execute_with_retries(self, executor, *args, **kwargs):
+        """
+        Call executor (normally self.cursor.execute or execute_prepared),
+        retrying on schema disagreement. Any other error is reported, and
+        False is returned.
+        """
         trynum = 1
         while True:
             try:
-                self.cursor.execute(statement, decoder=decoder)
-                break
+                executor(*args, **kwargs)
+                return True
             except cql.IntegrityError, err:
                 self.printerr("Attempt #%d: %s" % (trynum, str(err)))
                 trynum += 1
@@ -929,14 +1089,13 @@ class Shell(cmd.Cmd):
                 self.printerr(traceback.format_exc())
                 return False
 
-        if statement[:6].lower() == 'select' or statement.lower().startswith("list"):
-            self.print_result(self.cursor, with_default_limit)
-        elif self.cursor.rowcount > 0:
-            # CAS INSERT/UPDATE
-            self.writeresult("")
-            self.print_static_result(self.cursor)
-        self.flush_output()
-        return True
+    def execute_or_fail(self, statement, decoder=None):
+        """
+        Execute statement through execute_with_retries(), raising
+        StatementFailed once the error has been reported.
+        """
+        if not self.execute_with_retries(self.cursor.execute, statement, decoder=decoder):
+            raise StatementFailed(statement)
 
     def get_nametype(self, cursor, num):
         """
@@ -957,13 +1116,7 @@ class Shell(cmd.Cmd):
             self.print_static_result(cursor)
         self.writeresult("(%d rows)" % cursor.rowcount)
         self.writeresult("")
-
-        if self.decoding_errors:
-            for err in self.decoding_errors[:2]:
-                self.writeresult(err.message(), color=RED)
-            if len(self.decoding_errors) > 2:
-                self.writeresult('%d more decoding errors suppressed.'
-                                 % (len(self.decoding_errors) - 2), color=RED)
+        self.print_decoding_errors()
 
         if with_default_limit:
             if (self.is_count_result(cursor) and self.get_count(cursor) == DEFAULT_SELECT_LIMIT) \
@@ -979,42 +1132,268 @@ class Shell(cmd.Cmd):
     def get_count(self, cursor):
         return lookup_casstype('LongType').deserialize(cursor.result[0][0].value)
 
+    def print_decoding_errors(self):
+        if self.decoding_errors:
+            for err in self.decoding_errors[:2]:
+                self.writeresult(err.message(), color=RED)
+            if len(self.decoding_errors) > 2:
+                self.writeresult('%d more decoding errors suppressed.'
+                                 % (len(self.decoding_errors) - 2), color=RED)
+
     def print_static_result(self, cursor):
         colnames = [d[0] for d in cursor.description]
-        colnames_t = [(name, self.get_nametype(cursor, n)) for (n, name) in enumerate(colnames)]
-        formatted_names = [self.myformat_colname(name, nametype) for (name, nametype) in colnames_t]
-        formatted_values = [map(self.myformat_value, self.decode_row(cursor, row), cursor.column_types) for row in cursor.result]
+        nametypes = [self.get_nametype(cursor, n) for n in range(len(colnames))]
+        rows = (self.decode_row(cursor, row) for row in cursor.result)
+        self.print_rows(colnames, nametypes, cursor.column_types, rows)
+
+    def print_rows(self, colnames, nametypes, coltypes, rows, first_row=1,
+                   sample_size=WIDTH_SAMPLE_ROWS):
+        """
+        Print decoded rows with the given column names and types, as a table
+        or, with EXPAND ON, one row at a time, numbering them from first_row.
+        Either way, rows are printed as they come; tables are sized to fit
+        the first sample_size of them.
+        """
+        formatted_names = [self.myformat_colname(name, nametype)
+                           for (name, nametype) in zip(colnames, nametypes)]
+        formatted_values = (map(self.myformat_value, row, coltypes) for row in rows)
         if self.expand_enabled:
-            self.print_formatted_result_vertically(formatted_names, formatted_values)
+            self.print_formatted_result_vertically(formatted_names, formatted_values, first_row)
+        else:
+            fixed_widths = [fixed_width_for_type(coltype, self.display_time_format)
+                            for coltype in coltypes]
+            if self.max_col_width is not None:
+                # values are cut down to the maximum width before they get here
+                fixed_widths = [None if width is None else min(width, self.max_col_width)
+                                for width in fixed_widths]
+            self.print_formatted_result(formatted_names, formatted_values, fixed_widths,
+                                        sample_size)
+
+    def split_select(self, parsed, ks, cf):
+        """
+        Take apart the SELECT in parsed into the layout of its table, its
+        selectors (with * spelled out) and the text of its WHERE relations,
+        or return None if its rows can't be read any other way than it
+        says: counts, DISTINCT and ORDER BY queries, ones restricting the
+        token, and ones on tables that aren't known.
+        """
+        if ks is None:
+            ks = self.current_keyspace
+            if ks is None:
+                return None
+        if parsed.get_binding('star') is not None or parsed.get_binding('ordercol') is not None \
+                or parsed.get_binding('rel_tokname') is not None:
+            return None
+        tokens = parsed.matched
+        if tokens[1][1].lower() == 'distinct':
+            return None
+        try:
+            layout = self.get_columnfamily_layout(ks, cf)
+        except (KeyspaceNotFound, ColumnFamilyNotFound):
+            # let the server complain about it
+            return None
+
+        kinds = [t[0] for t in tokens]
+        selectors = parsed.extract_orig(tokens[1:kinds.index('K_FROM')])
+        if selectors == '*':
+            # nothing else can be selected along with *
+            columns = self.cql_protect_names(self.get_column_names(ks, cf))
         else:
-            self.print_formatted_result(formatted_names, formatted_values)
+            columns = [selectors]
+        where = None
+        if 'K_WHERE' in kinds:
+            start = end = kinds.index('K_WHERE') + 1
+            while end < len(kinds) and kinds[end] not in ('K_ORDER', 'K_LIMIT', 'endtoken'):
+                end += 1
+            where = parsed.extract_orig(tokens[start:end])
+        return layout, columns, where
+
+    def prep_paged_select(self, parsed, ks, cf, page_size, decoder=None, fetch_rows=None):
+        """
+        Return a pager whose pages() generates the rows of the SELECT in
+        parsed page_size at a time: a TokenPager, or a KeyContinuation for
+        a SELECT from a single partition. Returns None if it can't be paged
+        through: counts, DISTINCT and ORDER BY queries, ones restricting the
+        token or the clustering columns, and ones restricting the partition
+        key with IN or only in part. The values are decoded with decoder (by
+        default, ErrorHandlingSchemaDecoder), and fetch_rows (by default,
+        decode_row() on each row) is called with the cursor to take its rows.
+        """
+        split = self.split_select(parsed, ks, cf)
+        if split is None:
+            return None
+        layout, columns, where = split
+        restricted = set(map(self.cql_unprotect_name, parsed.get_binding('rel_lhs', ())))
+        if restricted & set(layout.clustering_key_columns):
+            return None
+        if decoder is None:
+            decoder = ErrorHandlingSchemaDecoder
+        if fetch_rows is None:
+            fetch_rows = lambda cursor: [self.decode_row(cursor, row) for row in cursor.result]
+        partition_key = set(layout.partition_key_columns)
+        if not restricted & partition_key:
+            return TokenPager.from_layout(self.cursor, layout, columns, page_size,
+                                          self.cql_protect_name, decoder=decoder, where=where,
+                                          fetch_rows=fetch_rows)
+        if 'K_IN' in [t[0] for t in parsed.matched] or not partition_key <= restricted:
+            return None
+        return KeyContinuation.from_layout(self.cursor, layout, columns, self.cql_protect_name,
+                                           decoder=decoder, where=where, single_partition=True,
+                                           fetch_rows=fetch_rows, page_size=page_size)
+
+    def prep_select_continuation(self, parsed, ks, cf):
+        """
+        Return a KeyContinuation reading the rows of the SELECT in parsed a
+        chunk at a time, or None if it can't be continued by primary key:
+        besides the queries split_select turns down, ones using IN,
+        restricting the clustering columns, or restricting only part of
+        the partition key.
+        """
+        split = self.split_select(parsed, ks, cf)
+        if split is None:
+            return None
+        layout, columns, where = split
+        if 'K_IN' in [t[0] for t in parsed.matched]:
+            return None
+        restricted = set(map(self.cql_unprotect_name, parsed.get_binding('rel_lhs', ())))
+        if restricted & set(layout.clustering_key_columns):
+            return None
+        partition_key = set(layout.partition_key_columns)
+        if restricted & partition_key and not partition_key <= restricted:
+            return None
+        return KeyContinuation.from_layout(self.cursor, layout, columns, self.cql_protect_name,
+                                           decoder=ErrorHandlingSchemaDecoder, where=where,
+                                           single_partition=partition_key <= restricted,
+                                           fetch_rows=lambda cursor: [self.decode_row(cursor, row)
+                                                                      for row in cursor.result],
+                                           execute=self.execute_or_fail)
+
+    def print_continued_select(self, continuation, limit):
+        """
+        Print the next chunk of up to limit rows from continuation, saying
+        how to get the next if there may be more. Returns False if the rows
+        couldn't be read, once the error has been reported.
+        """
+        self.decoding_errors = []
+        first_row = continuation.rows_read + 1
+        try:
+            rows = continuation.next_chunk(limit)
+        except StatementFailed:
+            return False
+
+        self.writeresult("")
+        if rows:
+            self.print_rows([d[0] for d in continuation.description],
+                            [info[1] for info in continuation.name_info],
+                            continuation.column_types, rows, first_row)
+        self.writeresult("(%d rows)" % len(rows))
+        self.writeresult("")
+        self.print_decoding_errors()
+
+        if not continuation.exhausted:
+            if first_row == 1:
+                self.writeresult("Default LIMIT of %d was used. Use MORE to see the next rows, "
+                                 "or specify your own LIMIT clause to get more results."
+                                 % (limit,), color=RED)
+            else:
+                self.writeresult("There may be more rows. Use MORE to see them.", color=RED)
+            self.writeresult("")
+        self.flush_output()
+        return True
+
+    def perform_paged_select(self, pager, limit=None):
+        """
+        Print the rows from pager (up to limit of them) a page at a time,
+        fetching the next page while the current one is printed. On a
+        terminal, ask before printing each page after the first.
+        """
+        self.decoding_errors = []
+        fetched = prefetched(pager.pages())
+        sizes = []
+
+        def pages():
+            for page in fetched:
+                if limit is not None:
+                    page = page[:limit - sum(sizes)]
+                if sizes and self.tty and not self.wait_for_more():
+                    return
+                sizes.append(len(page))
+                yield page
+                if limit is not None and sum(sizes) >= limit:
+                    return
+
+        self.writeresult("")
+        try:
+            paged = pages()
+            first = next(paged, None)
+            if first:
+                # one result throughout; a table is sized to fit the first page
+                self.print_rows([d[0] for d in pager.description],
+                                [info[1] for info in pager.name_info], pager.column_types,
+                                itertools.chain(first, (row for page in paged for row in page)),
+                                sample_size=len(first))
+        finally:
+            fetched.close()
+        self.writeresult("(%d rows)" % sum(sizes))
+        self.writeresult("")
+        self.print_decoding_errors()
+
+    def wait_for_more(self):
+        self.flush_output()
+        sys.stdout.write('---MORE--- (Enter for more, q to stop) ')
+        sys.stdout.flush()
+        answer = self.stdin.readline()
+        return answer and answer.strip().lower() != 'q'
+
+    def print_formatted_result(self, formatted_names, formatted_values, fixed_widths=(),
+                               sample_size=WIDTH_SAMPLE_ROWS):
+        """
+        Print formatted rows as a table as they come, rather than holding
+        them all to size the columns. The column widths are taken from the
+        first sample_size rows, and from fixed_widths, the widths every
+        value of a column is known to have (or None). A later value too
+        wide for its column widens it from there on, under a fresh header.
+        """
+        formatted_values = iter(formatted_values)
+        sample = list(itertools.islice(formatted_values, sample_size))
 
-    def print_formatted_result(self, formatted_names, formatted_values):
         # determine column widths
         widths = [n.displaywidth for n in formatted_names]
-        for fmtrow in formatted_values:
+        for num, width in enumerate(fixed_widths):
+            if width is not None:
+                widths[num] = max(widths[num], width)
+        for fmtrow in sample:
             for num, col in enumerate(fmtrow):
                 widths[num] = max(widths[num], col.displaywidth)
 
-        # print header
-        header = ' | '.join(hdr.ljust(w, color=self.color) for (hdr, w) in zip(formatted_names, widths))
-        self.writeresult(' ' + header.rstrip())
-        self.writeresult('-%s-' % '-+-'.join('-' * w for w in widths))
+        self.print_formatted_header(formatted_names, widths)
 
         # print row data
-        for row in formatted_values:
+        for row in itertools.chain(sample, formatted_values):
+            if any(col.displaywidth > w for (col, w) in zip(row, widths)):
+                widths = [max(w, col.displaywidth) for (col, w) in zip(row, widths)]
+                self.print_formatted_header(formatted_names, widths)
             line = ' | '.join(col.rjust(w, color=self.color) for (col, w) in zip(row, widths))
             self.writeresult(' ' + line)
 
         self.writeresult("")
 
-    def print_formatted_result_vertically(self, formatted_names, formatted_values):
+    def print_formatted_header(self, formatted_names, widths):
+        header = ' | '.join(hdr.ljust(w, color=self.color) for (hdr, w) in zip(formatted_names, widths))
+        self.writeresult(' ' + header.rstrip())
+        self.writeresult('-%s-' % '-+-'.join('-' * w for w in widths))
+
+    def print_formatted_result_vertically(self, formatted_names, formatted_values, first_row=1):
+        """
+        Print each formatted row as a block of its column-value pairs as
+        soon as it comes, with the separator sized to that row alone.
+        """
         max_col_width = max([n.displaywidth for n in formatted_names])
-        max_val_width = max([n.displaywidth for row in formatted_values for n in row])
 
         # for each row returned, list all the column-value pairs
         for row_id, row in enumerate(formatted_values):
-            self.writeresult("@ Row %d" % (row_id + 1))
+            max_val_width = max([n.displaywidth for n in row])
+            self.writeresult("@ Row %d" % (row_id + first_row))
             self.writeresult('-%s-' % '-+-'.join(['-' * max_col_width, '-' * max_val_width]))
             for field_id, field in enumerate(row):
                 column = formatted_names[field_id].ljust(max_col_width, color=self.color)
@@ -1350,6 +1729,7 @@ class Shell(cmd.Cmd):
 
           COPY x FROM: Imports CSV data into a Cassandra table
           COPY x TO: Exports data from a Cassandra table in CSV format.
+          COPY (SELECT ...) TO: Exports the results of a query in CSV format.
 
         COPY <table_name> [ ( column [, ...] ) ]
              FROM ( '<filename>' | STDIN )
@@ -1359,6 +1739,10 @@ class Shell(cmd.Cmd):
              TO ( '<filename>' | STDOUT )
              [ WITH <option>='value' [AND ...] ];
 
+        COPY ( SELECT ... )
+             TO ( '<filename>' | STDOUT )
+             [ WITH <option>='value' [AND ...] ];
+
         Available options and defaults:
 
           DELIMITER=','    - character that appears between records
@@ -1367,22 +1751,101 @@ class Shell(cmd.Cmd):
           HEADER=false     - whether to ignore the first line
           NULL=''          - string that represents a null value
           ENCODING='utf8'  - encoding for CSV output (COPY TO only)
+          PAGESIZE=1000    - how many rows to fetch at a time (COPY TO only)
+          CONCATENATE=true - whether to join up the files exported by each
+                             worker into the one file, rather than leave one
+                             file per token range, named like
+                             <name>.part00001.csv (COPY TO only)
+          MAXOUTPUTSIZE    - most rows to write to one file. Once a file is
+                             full, the export goes on in the next one, named
+                             like <name>.0001.csv, <name>.0002.csv and so on,
+                             and <name>.csv.index lists them with their row
+                             counts. Each file has its own header (COPY TO
+                             only)
+          MAXOUTPUTBYTES   - most bytes (before compression) to write to one
+                             file, moving on to the next as for MAXOUTPUTSIZE.
+                             A file may go over by at most one row (COPY TO
+                             only)
+          MODE='text'      - 'raw' to write each value as the bytes Cassandra
+                             stores, encoded as text (see RAWENCODING),
+                             without decoding or formatting it. Much cheaper
+                             for backups that needn't be human-readable;
+                             COPY FROM can't read it back (COPY TO only)
+          RAWENCODING='hex' - 'hex' or 'base64', for MODE='raw' (COPY TO
+                             only)
+          COMPRESSION='auto' - compression of the file read or written:
+                             'gzip', 'bz2' or 'none'. 'auto' picks one
+                             from the file's extension (.gz, .bz2)
+          FORMAT='csv'     - 'binary' to dump the values exactly as Cassandra
+                             stores them, with the column names and types,
+                             instead of as CSV text. Binary dumps are read
+                             back into the columns named in them, and need
+                             prepared statements. The CSV options don't
+                             apply, nor do CHECKPOINT and ERRFILE
+          PREPAREDSTATEMENTS=true - whether to convert values client-side and
+                             insert them through a prepared statement, rather
+                             than sending each row as CQL literals (COPY FROM
+                             only)
+          NUMPROCESSES=1   - number of worker processes, each with its own
+                             connection, to insert or export rows with. COPY
+                             TO a file splits the ring into token ranges for
+                             the workers, and reads each range from one of
+                             its replicas
+          MAXINFLIGHT=1    - when greater than 1, insert over a native protocol
+                             connection with up to this many requests (at most
+                             128) outstanding at once. Requires prepared
+                             statements (so column types they can't bind are
+                             ruled out), and can't be used with a transport
+                             factory other than the default one, since the
+                             native connections don't go through it.
+                             NATIVEPORT, TOKENAWARE and ADAPTIVE only apply
+                             along with it (COPY FROM only)
+          NATIVEPORT=9042  - native protocol port used when MAXINFLIGHT is
+                             greater than 1 (COPY FROM only)
+          MAXBATCHSIZE=20  - most rows to insert in one UNLOGGED BATCH. Only
+                             rows for the same partition, with the same null
+                             fields, are batched together, a row for a primary
+                             key already in a batch goes in the next one, and
+                             batches are also kept to a few kB of data (COPY
+                             FROM only)
+          TOKENAWARE=true  - when inserting over the native protocol, send
+                             each batch directly to a replica for its
+                             partition (COPY FROM only)
+          CHECKPOINT=''    - file in which to keep recording how far into
+                             the input every record has been imported
+                             (COPY FROM a file only)
+          RESUME=false     - whether to skip straight to the position saved
+                             in the CHECKPOINT file and carry on importing
+                             from there (COPY FROM a file only)
+          MAXERRORS=0      - how many rows may fail to import before the
+                             import is aborted; -1 means no limit. Failed
+                             rows are skipped (COPY FROM only)
+          ERRFILE=''       - CSV file to write skipped rows to, so they can
+                             be fixed up and imported again (COPY FROM only)
+          MAXATTEMPTS=5    - how many times to try rows which fail because
+                             of timeouts or unavailable nodes, backing off
+                             exponentially in between (COPY FROM only)
+          INGESTRATE=0     - most rows per second to insert, across all
+                             worker processes; 0 means no limit (COPY FROM
+                             only)
+          ADAPTIVE=false   - whether to start with one outstanding request
+                             and work up towards MAXINFLIGHT, halving the
+                             number whenever nodes time out or report being
+                             unavailable or overloaded (COPY FROM only)
 
         When entering CSV data on STDIN, you can use the sequence "\."
         on a line by itself to end the data input.
+
+        COPY (SELECT ...) TO writes out every row the query returns (there is
+        no default LIMIT, unlike for a plain SELECT), with the column names
+        of the result for a header. The rows are read PAGESIZE at a time
+        where the query allows it, as for PAGING ON. FORMAT='binary' and
+        NUMPROCESSES don't apply to it.
+
+        When standard error is a terminal, COPY to or from a file shows a
+        progress line there, with the rate and, for imports of uncompressed
+        files, an estimate of the time left.
         """
-        ks = self.cql_unprotect_name(parsed.get_binding('ksname', None))
-        if ks is None:
-            ks = self.current_keyspace
-            if ks is None:
-                raise NoKeyspaceError("Not in any keyspace.")
-        cf = self.cql_unprotect_name(parsed.get_binding('cfname'))
-        columns = parsed.get_binding('colnames', None)
-        if columns is not None:
-            columns = map(self.cql_unprotect_name, columns)
-        else:
-            # default to all known columns
-            columns = self.get_column_names(ks, cf)
         fname = parsed.get_binding('fname', None)
         if fname is not None:
             fname = os.path.expanduser(self.cql_unprotect_value(fname))
@@ -1391,22 +1854,45 @@ class Shell(cmd.Cmd):
         cleancopyoptvals  = [optval.decode('string-escape') for optval in copyoptvals]
         opts = dict(zip(copyoptnames, cleancopyoptvals))
 
-        timestart = time.time()
-
-        direction = parsed.get_binding('dir').upper()
-        if direction == 'FROM':
-            rows = self.perform_csv_import(ks, cf, columns, fname, opts)
-            verb = 'imported'
-        elif direction == 'TO':
-            rows = self.perform_csv_export(ks, cf, columns, fname, opts)
+        query = parsed.get_binding('query', None)
+        if query is not None:
+            timestart = time.time()
+            rows = self.perform_query_export(query, fname, opts)
             verb = 'exported'
         else:
-            raise SyntaxError("Unknown direction %s" % direction)
+            ks = self.cql_unprotect_name(parsed.get_binding('ksname', None))
+            if ks is None:
+                ks = self.current_keyspace
+                if ks is None:
+                    raise NoKeyspaceError("Not in any keyspace.")
+            cf = self.cql_unprotect_name(parsed.get_binding('cfname'))
+            columns = parsed.get_binding('colnames', None)
+            if columns is not None:
+                columns = map(self.cql_unprotect_name, columns)
+            else:
+                # default to all known columns
+                columns = self.get_column_names(ks, cf)
+
+            timestart = time.time()
+
+            direction = parsed.get_binding('dir').upper()
+            if direction == 'FROM':
+                rows = self.perform_csv_import(ks, cf, columns, fname, opts)
+                verb = 'imported'
+            elif direction == 'TO':
+                rows = self.perform_csv_export(ks, cf, columns, fname, opts)
+                verb = 'exported'
+            else:
+                raise SyntaxError("Unknown direction %s" % direction)
 
-        timeend = time.time()
-        print "%d rows %s in %s." % (rows, verb, describe_interval(timeend - timestart))
+        elapsed = time.time() - timestart
+        rate = rows / elapsed if elapsed > 0 else 0
+        print "%d rows %s in %s (%.0f rows/s)." % (rows, verb, describe_interval(elapsed), rate)
 
     def perform_csv_import(self, ks, cf, columns, fname, opts):
+        # the options which only matter for inserts over the native protocol
+        pipelining_opts = [name.upper() for name in ('nativeport', 'tokenaware', 'adaptive')
+                           if name in opts]
         dialect_options = self.csv_dialect_defaults.copy()
         if 'quote' in opts:
             dialect_options['quotechar'] = opts.pop('quote')
@@ -1414,8 +1900,28 @@ class Shell(cmd.Cmd):
             dialect_options['escapechar'] = opts.pop('escape')
         if 'delimiter' in opts:
             dialect_options['delimiter'] = opts.pop('delimiter')
-        nullval = opts.pop('null', '')
         header = bool(opts.pop('header', '').lower() == 'true')
+        checkpoint_file = opts.pop('checkpoint', None)
+        resume = bool(opts.pop('resume', '').lower() == 'true')
+        errfile = opts.pop('errfile', None)
+        compression = opts.pop('compression', 'auto')
+        binary = opts.pop('format', 'csv').lower() == 'binary'
+        settings = dict(nullval=opts.pop('null', ''),
+                        use_prepared=bool(opts.pop('preparedstatements', 'true').lower() == 'true'),
+                        tokenaware=bool(opts.pop('tokenaware', 'true').lower() == 'true'),
+                        adaptive=bool(opts.pop('adaptive', '').lower() == 'true'))
+        try:
+            numprocesses = int(opts.pop('numprocesses', 1))
+            settings['maxinflight'] = int(opts.pop('maxinflight', 1))
+            settings['nativeport'] = int(opts.pop('nativeport', DEFAULT_NATIVE_PORT))
+            settings['maxbatchsize'] = int(opts.pop('maxbatchsize', 20))
+            settings['maxerrors'] = int(opts.pop('maxerrors', 0))
+            settings['maxattempts'] = int(opts.pop('maxattempts', 5))
+            settings['ingestrate'] = float(opts.pop('ingestrate', 0))
+            compression = compression_for(fname or '', compression)
+        except ValueError, e:
+            self.printerr('Invalid COPY FROM option value: %s' % (e,))
+            return 0
         if dialect_options['quotechar'] == dialect_options['escapechar']:
             dialect_options['doublequote'] = True
             del dialect_options['escapechar']
@@ -1423,7 +1929,62 @@ class Shell(cmd.Cmd):
             self.printerr('Unrecognized COPY FROM options: %s'
                           % ', '.join(opts.keys()))
             return 0
+        if settings['maxinflight'] > 1 \
+                and self.transport_factory is not load_factory(DEFAULT_TRANSPORT_FACTORY):
+            # the native protocol connections would bypass its encryption or
+            # whatever else it sets up
+            self.printerr("MAXINFLIGHT can't be greater than 1 with a transport factory "
+                          "other than %s." % (DEFAULT_TRANSPORT_FACTORY,))
+            return 0
+        if checkpoint_file is None and resume:
+            self.printerr('RESUME requires a CHECKPOINT file.')
+            return 0
+        if checkpoint_file is not None and fname is None:
+            self.printerr("CHECKPOINT can't be used when importing from STDIN.")
+            return 0
+        if compression is not None and fname is None:
+            self.printerr("COMPRESSION can't be used when importing from STDIN.")
+            return 0
+        if binary:
+            if fname is None or checkpoint_file is not None or errfile is not None:
+                self.printerr("FORMAT='binary' needs a file, and can't be used with "
+                              "CHECKPOINT or ERRFILE.")
+                return 0
+            if not (settings['use_prepared'] and self.cursor.supports_prepared_queries):
+                self.printerr("FORMAT='binary' needs prepared statements.")
+                return 0
+            settings['format'] = 'binary'
+            # dumps describe their own columns
+            header = False
+        if settings['maxinflight'] <= 1:
+            if pipelining_opts:
+                self.printerr('%s only appl%s when MAXINFLIGHT is greater than 1.'
+                              % (' and '.join(pipelining_opts),
+                                 'ies' if len(pipelining_opts) == 1 else 'y'))
+                return 0
+        elif not settings['use_prepared']:
+            self.printerr('MAXINFLIGHT greater than 1 needs prepared statements.')
+            return 0
+        elif not binary and self.make_import_converter(self.get_columnfamily_layout(ks, cf),
+                                                       columns, settings['nullval']) is None:
+            self.printerr("MAXINFLIGHT greater than 1 needs prepared statements, which can't "
+                          "be used for these columns; leave it out to insert the rows as "
+                          "CQL literals.")
+            return 0
 
+        checkpoint = None
+        if checkpoint_file is not None:
+            checkpoint_file = os.path.expanduser(checkpoint_file)
+            source = os.path.abspath(fname)
+            if resume:
+                try:
+                    checkpoint = ImportCheckpoint.load(checkpoint_file, source)
+                except (IOError, ValueError, KeyError), e:
+                    self.printerr("Can't resume from checkpoint %r: %s" % (checkpoint_file, e))
+                    return 0
+            else:
+                checkpoint = ImportCheckpoint(checkpoint_file, source)
+            settings['checkpoint'] = checkpoint_file
         if fname is None:
             do_close = False
             print "[Use \. on a line by itself to end input]"
@@ -1431,70 +1992,544 @@ class Shell(cmd.Cmd):
         else:
             do_close = True
             try:
-                linesource = open(fname, 'rb')
+                linesource = open_compressed(fname, 'rb', compression)
             except IOError, e:
                 self.printerr("Can't open %r for reading: %s" % (fname, e))
                 return 0
+        errors = ImportErrorHandler(settings['maxerrors'], settings['maxattempts'])
+        if errfile is not None:
+            errfile = os.path.expanduser(errfile)
+            try:
+                errout = open(errfile, 'ab' if resume else 'wb')
+            except IOError, e:
+                self.printerr("Can't open %r for writing: %s" % (errfile, e))
+                if do_close:
+                    linesource.close()
+                return 0
+            errwriter = csv.writer(errout, **dialect_options)
+
+        progress = None
+        if fname is not None and sys.stderr.isatty():
+            total_bytes = None
+            if compression is None and os.path.isfile(fname):
+                total_bytes = os.path.getsize(fname)
+            progress = ProgressReporter('Processed', total_bytes,
+                                        position=lambda: linesource.tell(),
+                                        errors=lambda: errors.rejected)
+
+        def write_rejects(batch, message):
+            if progress is not None:
+                progress.finish()
+            for rownum, linenum, row in batch:
+                self.printerr('Rejected record #%d (line %d): %s' % (rownum, linenum, message))
+                if errfile is not None:
+                    errwriter.writerow(row)
+        errors.on_reject = write_rejects
+
         try:
-            if header:
-                linesource.next()
-            layout = self.get_columnfamily_layout(ks, cf)
-            rownum = -1
-            reader = csv.reader(linesource, **dialect_options)
-            for rownum, row in enumerate(reader):
-                if len(row) != len(columns):
-                    self.printerr("Record #%d (line %d) has the wrong number of fields "
-                                  "(%d instead of %d)."
-                                  % (rownum, reader.line_num, len(row), len(columns)))
-                    return rownum
-                if not self.do_import_row(columns, nullval, layout, row):
-                    self.printerr("Aborting import at record #%d (line %d). "
-                                  "Previously-inserted values still present."
-                                  % (rownum, reader.line_num))
-                    return rownum
+            firstrow = firstline = offset = 0
+            if checkpoint is not None:
+                offset, firstrow, firstline = checkpoint.position
+                linesource.seek(offset)
+            if header and firstline == 0:
+                if fname is None:
+                    linesource.next()
+                else:
+                    # not next(), which reads ahead and loses track of the offset
+                    offset += len(linesource.readline())
+                firstline = 1
+            if binary:
+                try:
+                    reader = BinaryDumpReader(linesource)
+                except ValueError, e:
+                    self.printerr("Can't read %r: %s" % (fname, e))
+                    return 0
+                if not self.check_binary_dump_columns(ks, cf, columns, reader):
+                    return 0
+                columns = reader.columns
+            elif numprocesses > 1 and fname is not None and os.path.isfile(fname) \
+                    and compression is None:
+                # let the workers parse the file too
+                settings['csvfile'] = fname
+                settings['dialect'] = dialect_options
+                chunks = self.split_import_file(linesource, offset, firstrow, firstline,
+                                                dialect_options, numprocesses, checkpoint)
+                return self.perform_csv_import_parallel(ks, cf, columns, settings, chunks,
+                                                        numprocesses, errors, checkpoint,
+                                                        progress)
+            if checkpoint is not None:
+                linesource = OffsetTrackingReader(linesource, offset)
+            if not binary:
+                reader = csv.reader(linesource, **dialect_options)
+            records = self.read_import_records(reader, columns, firstrow, firstline)
+            if checkpoint is not None:
+                records = checkpoint.track(records, linesource)
+            if numprocesses > 1:
+                return self.perform_csv_import_parallel(ks, cf, columns, settings,
+                                                        self.chunk_import_records(records),
+                                                        numprocesses, errors, checkpoint,
+                                                        progress)
+            importer = self.make_importer(ks, cf, columns, settings, errors)
+
+            def finished(batch):
+                if checkpoint is not None:
+                    checkpoint.acknowledge(record[0] for record in batch)
+                if progress is not None:
+                    progress.update(len(batch))
+            importer.on_finished = finished
+            if progress is not None:
+                progress.in_flight = importer.requests_in_flight
+            try:
+                rows, failure = importer.import_records(records)
+            finally:
+                importer.close()
+            if failure is not None:
+                if progress is not None:
+                    progress.finish()
+                self.report_import_failure(failure)
+            return rows
         finally:
+            if progress is not None:
+                progress.finish()
             if do_close:
                 linesource.close()
             elif self.tty:
                 print
-        return rownum + 1
-
-    def do_import_row(self, columns, nullval, layout, row):
-        rowmap = {}
-        for name, value in zip(columns, row):
-            type = layout.get_column(name).cqltype
-            if issubclass(type, ReversedType):
-                type = type.subtypes[0]
-            cqltype = type.cql_parameterized_type()
-
-            if value != nullval:
-                if cqltype in ('ascii', 'text', 'timestamp', 'inet'):
-                    rowmap[name] = self.cql_protect_value(value)
+            if errfile is not None:
+                errout.close()
+            if errors.rejected:
+                print '%d rows rejected%s.' % (errors.rejected,
+                                               ' and written to %r' % errfile if errfile else '')
+            if checkpoint is not None:
+                self.save_import_checkpoint(checkpoint)
+
+    def save_import_checkpoint(self, checkpoint):
+        try:
+            checkpoint.save()
+        except (IOError, OSError), e:
+            self.printerr("Can't save checkpoint %r: %s" % (checkpoint.filename, e))
+            return
+        if checkpoint.pending:
+            offset, rownum, linenum = checkpoint.position
+            print 'Records before #%d (line %d) are imported; use RESUME=true to continue ' \
+                  'from there.' % (rownum, linenum + 1)
+
+    def check_binary_dump_columns(self, ks, cf, columns, reader):
+        """
+        Make sure the columns in a binary dump, as read by a BinaryDumpReader,
+        are among the ones being imported into and have the same types as in
+        the table.
+        """
+        layout = self.get_columnfamily_layout(ks, cf)
+        for name, coltype in zip(reader.columns, reader.coltypes):
+            if name not in columns:
+                self.printerr('Column %r in the dump is not one of the columns to import.'
+                              % (name,))
+                return False
+            typename = coltype.cass_parameterized_type(full=True)
+            if column_type(layout, name).cass_parameterized_type(full=True) != typename:
+                self.printerr('Column %r is %s in the dump, but %s in the table.'
+                              % (name, coltype.cql_parameterized_type(),
+                                 column_type(layout, name).cql_parameterized_type()))
+                return False
+        return True
+
+    def read_import_records(self, reader, columns, firstrow=0, firstline=0, failures=None):
+        """
+        Generate (rownum, linenum, row) tuples from a csv reader, stopping at
+        the first record with the wrong number of fields. Numbering starts
+        after firstrow records and firstline lines, for resumed imports and
+        parts of files. The bad record is reported, or appended to failures
+        if that is given.
+        """
+        for rownum, row in enumerate(reader, firstrow):
+            linenum = firstline + reader.line_num
+            if len(row) != len(columns):
+                message = ("Record #%d (line %d) has the wrong number of fields "
+                           "(%d instead of %d)." % (rownum, linenum, len(row), len(columns)))
+                if failures is None:
+                    self.printerr(message)
                 else:
-                    rowmap[name] = value
-            elif name in layout.clustering_key_columns and not type.empty_binary_ok:
-                rowmap[name] = 'blobAs%s(0x)' % cqltype.title()
-            else:
-                rowmap[name] = 'null'
-        return self.do_import_insert(layout, rowmap)
-
-    def do_import_insert(self, layout, rowmap):
-        # would be nice to be able to use a prepared query here, but in order
-        # to use that interface, we'd need to have all the input as native
-        # values already, reading them from text just like the various
-        # Cassandra cql types do. Better just to submit them all as intact
-        # CQL string literals and let Cassandra do its thing.
-        query = 'INSERT INTO %s.%s (%s) VALUES (%s)' % (
-            self.cql_protect_name(layout.keyspace_name),
-            self.cql_protect_name(layout.columnfamily_name),
-            ', '.join(self.cql_protect_names(rowmap.keys())),
-            ', '.join(rowmap.values())
-        )
+                    failures.append((rownum, linenum, message))
+                return
+            yield rownum, linenum, row
+
+    def chunk_import_records(self, records):
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= self.import_chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def split_import_file(self, f, offset, firstrow, firstline, dialect_options, numprocesses,
+                          checkpoint):
+        """
+        Generate (start, end, firstrow, firstline) descriptions of the parts
+        of the CSV file f, from offset onwards, for import workers to read.
+        Parts are import_split_size bytes at most, but small enough to give
+        each of the numprocesses workers several.
+        """
+        remaining = os.fstat(f.fileno()).st_size - offset
+        split_size = min(self.import_split_size, max(remaining // (numprocesses * 8), 64 * 1024))
+        for start, end, records, lines in split_csv_file(f, offset, split_size,
+                                                         **dialect_options):
+            if checkpoint is not None and records:
+                checkpoint.expect(firstrow + records - 1, end, firstline + lines)
+            # so that f.tell() shows how much of the file has been handed out
+            f.seek(end)
+            yield start, end, firstrow, firstline
+            firstrow += records
+            firstline += lines
+
+    def read_import_file_part(self, fname, dialect_options, columns, part, failures):
+        """
+        Generate the records in one of the parts of a CSV file described by
+        split_import_file().
+        """
+        start, end, firstrow, firstline = part
+        f = open(fname, 'rb')
+        try:
+            f.seek(start)
+            data = f.read(end - start)
+        finally:
+            f.close()
+        reader = csv.reader(StringIO(data), **dialect_options)
+        return self.read_import_records(reader, columns, firstrow, firstline, failures)
+
+    def report_import_failure(self, failure):
+        rownum, linenum, message = failure
+        if message is not None:
+            self.printerr(message)
+        self.printerr("Aborting import at record #%d (line %d). "
+                      "Previously-inserted values still present."
+                      % (rownum, linenum))
+
+    def make_importer(self, ks, cf, columns, settings, errors):
+        """
+        Set up whatever is needed to insert rows into the given table with
+        the given COPY FROM settings, handling failures with the given
+        ImportErrorHandler. The returned object has an import_records()
+        method taking (rownum, linenum, row) tuples and a close() method.
+        """
+        layout = self.get_columnfamily_layout(ks, cf)
+        nullval = settings['nullval']
+        converter = None
+        if settings.get('format') == 'binary':
+            converter = BinaryImportConverter.from_layout(layout, columns, nullval,
+                                                          self.cql_protect_name)
+        elif settings['use_prepared']:
+            converter = self.make_import_converter(layout, columns, nullval)
+        literals = LiteralConverter.from_layout(layout, columns, nullval,
+                                                self.cql_protect_name, self.cql_protect_value)
+        partition_key = primary_key = None
+        if set(layout.partition_key_columns) <= set(columns):
+            partition_key = operator.itemgetter(*[columns.index(name) for name
+                                                  in layout.partition_key_columns])
+            key_columns = layout.partition_key_columns + layout.clustering_key_columns
+            if set(key_columns) <= set(columns):
+                primary_key = operator.itemgetter(*[columns.index(name) for name in key_columns])
+        # batches of rows with the same null fields share a prepared statement
+        nullmask = converter.nullmask if converter is not None else None
+        group = lambda records: group_into_batches(records, partition_key,
+                                                   settings['maxbatchsize'], nullmask=nullmask,
+                                                   primary_key=primary_key)
+        if converter is not None and settings['maxinflight'] > 1:
+            def open_importer(host, group=None):
+                conn = cql.connect(host, settings['nativeport'], keyspace=ks,
+                                   user=self.username, password=self.password, native=True,
+                                   consistency_level=self.cursor.consistency_level)
+                return PipelinedImporter(conn, converter, settings['maxinflight'],
+                                         self.cursor.consistency_level, group=group,
+                                         errors=errors, adaptive=settings['adaptive'],
+                                         literals=literals)
+            importer = open_importer(self.hostname, group)
+            if settings['tokenaware']:
+                importer = self.make_token_aware_importer(ks, converter, importer,
+                                                          open_importer, group)
+        else:
+            importer = SynchronousImporter(lambda rows: self.import_rows(converter, literals, rows),
+                                           group=group, errors=errors)
+        if settings['ingestrate'] > 0:
+            importer.rate_limiter = RateLimiter(settings['ingestrate'])
+        return importer
+
+    def make_token_aware_importer(self, ks, converter, importer, open_importer, group):
+        """
+        Wrap the PipelinedImporter connected to our host in a
+        TokenAwareImporter, if the partitioner and table allow it.
+        """
+        try:
+            token_for = token_function(self.get_partitioner())
+            token_map = TokenMap.from_ring(self.get_ring(ks))
+        except Exception, e:
+            if self.debug:
+                print "Can't get ring (%s); inserting through %s" % (e, self.hostname)
+            return importer
+        if token_for is None or converter.partition_key_indexes is None:
+            if self.debug:
+                print 'Partition tokens can not be computed; inserting through %s' % self.hostname
+            return importer
+
+        def open_replica_importer(host):
+            try:
+                return open_importer(host)
+            except Exception, e:
+                if self.debug:
+                    print "Can't connect to replica %s (%s); inserting through %s" \
+                          % (host, e, self.hostname)
+                return None
+
+        return TokenAwareImporter(importer, converter, token_for, token_map,
+                                  open_replica_importer, group=group)
+
+    def perform_csv_import_parallel(self, ks, cf, columns, settings, chunks, numprocesses,
+                                    errors, checkpoint=None, progress=None):
+        """
+        Hand chunks of work out to numprocesses workers which each insert
+        over their own connection. A chunk is either a list of records or,
+        when settings has a 'csvfile', a part of that file for the worker to
+        parse itself. Returns the number of rows the workers reported as
+        imported. The workers pass rows they fail to insert back to be
+        counted against errors, and report which records they are done with
+        to the checkpoint, if any, and how many rows to the ProgressReporter,
+        if any.
+        """
+        shell_args = dict(hostname=self.hostname, port=self.port,
+                          transport_factory=self.transport_factory,
+                          username=self.username, password=self.password,
+                          encoding=self.encoding, cqlver=self.cql_version, keyspace=ks)
+        # each worker gets an equal share of the ingest rate
+        settings = dict(settings, ingestrate=settings['ingestrate'] / numprocesses)
+        inqueue = multiprocessing.Queue(numprocesses * 2)
+        outqueue = multiprocessing.Queue()
+        abort = multiprocessing.Event()
+        workers = []
+        for workerid in range(numprocesses):
+            worker = multiprocessing.Process(target=import_worker,
+                                             args=(workerid, shell_args, self.cursor.consistency_level,
+                                                   self.debug, ks, cf, columns, settings,
+                                                   inqueue, outqueue, abort))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        imported = {}
+        failures = []
+        refused = set()
+
+        def handle_message(msg):
+            kind, workerid = msg[:2]
+            if kind == 'done':
+                imported[workerid] = msg[2]
+            elif kind == 'rejected':
+                batch, message = msg[2:]
+                if errors.reject(batch, message):
+                    if progress is not None:
+                        progress.update(len(batch))
+                else:
+                    rownum, linenum, _ = batch[0]
+                    failures.append((rownum, linenum, message))
+                    refused.update(record[0] for record in batch)
+                    abort.set()
+            elif kind == 'acked':
+                if checkpoint is not None:
+                    checkpoint.acknowledge(n for n in msg[2] if n not in refused)
+            elif kind == 'progress':
+                if progress is not None:
+                    progress.update(msg[2])
+            elif kind == 'failed':
+                failures.append(msg[2])
+                abort.set()
+            elif kind == 'error':
+                if progress is not None:
+                    progress.finish()
+                self.printerr('Worker #%d failed: %s' % (workerid, msg[2]))
+                abort.set()
+
+        def handle_pending_messages():
+            while not outqueue.empty():
+                handle_message(outqueue.get())
+
+        def send_to_workers(item):
+            while True:
+                try:
+                    inqueue.put(item, timeout=1)
+                    return True
+                except Queue.Full:
+                    handle_pending_messages()
+                    if progress is not None:
+                        progress.update()
+                    if not any(w.is_alive() for w in workers):
+                        return False
+
+        def wait_for_workers():
+            while len(imported) < len(workers):
+                try:
+                    handle_message(outqueue.get(timeout=1))
+                except Queue.Empty:
+                    if not any(w.is_alive() for w in workers):
+                        break
+                    if progress is not None:
+                        progress.update()
+
+        try:
+            for chunk in chunks:
+                if abort.is_set() or not send_to_workers(chunk):
+                    break
+                handle_pending_messages()
+            for worker in workers:
+                send_to_workers(None)
+            wait_for_workers()
+        finally:
+            for worker in workers:
+                if worker.is_alive() and len(imported) < len(workers):
+                    worker.terminate()
+                worker.join()
+
+        if progress is not None:
+            progress.finish()
+        if failures:
+            self.report_import_failure(min(failures))
+        if self.debug:
+            for workerid, rows in sorted(imported.items()):
+                print 'Worker #%d imported %d rows' % (workerid, rows)
+        return sum(imported.values())
+
+    def import_rows(self, converter, literals, rows):
+        """
+        Insert the given CSV rows in one statement. Raises a cql.Error if
+        that fails.
+        """
+        if converter is not None:
+            return self.do_import_rows_prepared(converter, literals, rows)
+        return self.do_import_rows(literals, rows)
+
+    def make_import_converter(self, layout, columns, nullval):
+        if not self.cursor.supports_prepared_queries:
+            return None
+        converter = ImportConverter.from_layout(layout, columns, nullval,
+                                                self.cql_protect_name)
+        if converter is None and self.debug:
+            print 'Some column types are not supported by prepared import; using CQL literals'
+        return converter
+
+    def do_import_rows_prepared(self, converter, literals, rows):
+        try:
+            key, params = converter.convert_rows(rows)
+            prepared = self.get_import_prepared(converter, key)
+            params = prepared.encode_params(params)
+        except CONVERSION_ERRORS:
+            # let Cassandra interpret the values and produce a proper error
+            return self.do_import_rows(literals, rows)
+        self.cursor.execute_prepared(EncodedParamsQuery(prepared), params)
+
+    def get_import_prepared(self, converter, key):
+        prepared = converter.prepared.get(key)
+        if prepared is None:
+            query = converter.query_for(key)
+            if self.debug:
+                print 'Import using prepared CQL: %s' % query
+            prepared = converter.adapt_prepared(self.cursor.prepare_query(query))
+            converter.prepared[key] = prepared
+        return prepared
+
+    def do_import_rows(self, literals, rows):
+        self.do_import_insert(literals.query_for(rows))
+
+    def do_import_insert(self, query):
         if self.debug:
             print 'Import using CQL: %s' % query
-        return self.perform_statement_untraced(query)
+        self.cursor.execute(query)
 
     def perform_csv_export(self, ks, cf, columns, fname, opts):
+        settings = self.parse_export_options(fname, opts)
+        if settings is None:
+            return 0
+        if settings['numprocesses'] > 1 and fname is not None:
+            ranges = self.get_export_ranges(ks, settings['numprocesses'])
+            if ranges is not None:
+                return self.perform_csv_export_parallel(ks, cf, columns, fname,
+                                                        settings['compression'], settings,
+                                                        ranges, settings['numprocesses'],
+                                                        settings['concatenate'])
+        return self.write_export(ks, cf, columns, fname, settings,
+                                 lambda writer, progress:
+                                     self.export_range(ks, cf, columns, writer, settings,
+                                                       progress=progress))
+
+    def perform_query_export(self, query, fname, opts):
+        """
+        Export the rows of a SELECT query. They are read a page at a time
+        through the pager prep_paged_select() gives for the query, if any,
+        and otherwise fetched all at once, as for any query, but decoded and
+        written a page at a time.
+        """
+        settings = self.parse_export_options(fname, opts)
+        if settings is None:
+            return 0
+        if settings['binary']:
+            self.printerr("FORMAT='binary' can't be used with COPY (SELECT ...).")
+            return 0
+        if settings['numprocesses'] > 1:
+            self.printerr("NUMPROCESSES can't be used with COPY (SELECT ...).")
+            return 0
+        if settings['raw'] is not None:
+            decoder = SerializedValueDecoder
+            fetch_rows = serialized_rows
+        else:
+            decoder = ErrorHandlingSchemaDecoder
+            fetch_rows = lambda cursor: cursor.fetchall()
+        parsed = self.parse_statement(query + ';')
+        limit = parsed.get_binding('limit')
+        if limit is not None:
+            limit = int(limit)
+        ksname = parsed.get_binding('ksname')
+        if ksname is not None:
+            ksname = self.cql_unprotect_name(ksname)
+        cfname = self.cql_unprotect_name(parsed.get_binding('cfname'))
+        pager = self.prep_paged_select(parsed, ksname, cfname,
+                                       min(settings['pagesize'], limit or settings['pagesize']),
+                                       decoder, fetch_rows)
+        if pager is not None:
+            pages = pager.pages()
+        else:
+            if limit is None:
+                query = '%s LIMIT %d' % (query, UNLIMITED_SELECT_LIMIT)
+            if not self.execute_with_retries(self.cursor.execute, query, decoder=decoder):
+                return 0
+            # the cursor describes its result just as a pager does
+            pager = self.cursor
+            pages = self.fetched_pages(settings)
+        first = next(pages, [])
+        if first:
+            columns = [d[0] for d in pager.description]
+        else:
+            # the result's columns are only known when there are rows
+            columns = []
+            settings['header'] = False
+        return self.write_export(None, None, columns, fname, settings,
+                                 lambda writer, progress:
+                                     self.export_query_rows(writer, pager.column_types,
+                                                            itertools.chain([first], pages),
+                                                            settings, limit, progress))
+
+    def parse_statement(self, statement):
+        """
+        Parse the text of a single complete statement, such as a SELECT
+        nested in a COPY, as for running it.
+        """
+        tokens = cqlruleset.cql_split_statements(statement)[0][0]
+        return cqlruleset.cql_whole_parse_tokens(tokens, srcstr=statement,
+                                                 startsymbol='cqlshCommand')
+
+    def parse_export_options(self, fname, opts):
+        """
+        Check the COPY TO options in opts and turn them into the settings
+        for an export to fname, or return None if they won't do.
+        """
         dialect_options = self.csv_dialect_defaults.copy()
         if 'quote' in opts:
             dialect_options['quotechar'] = opts.pop('quote')
@@ -1505,6 +2540,38 @@ class Shell(cmd.Cmd):
         encoding = opts.pop('encoding', 'utf8')
         nullval = opts.pop('null', '')
         header = bool(opts.pop('header', '').lower() == 'true')
+        binary = opts.pop('format', 'csv').lower() == 'binary'
+        concatenate = bool(opts.pop('concatenate', 'true').lower() == 'true')
+        mode = opts.pop('mode', 'text').lower()
+        raw_encoding = opts.pop('rawencoding', None)
+        try:
+            if mode not in ('text', 'raw'):
+                raise ValueError("unknown mode %r (use one of: text, raw)" % (mode,))
+            if mode == 'raw':
+                raw_encoding = (raw_encoding or 'hex').lower()
+                # fail now rather than in the workers
+                raw_value_encoder(raw_encoding, nullval)
+            elif raw_encoding is not None:
+                raise ValueError("RAWENCODING only applies to MODE='raw'")
+            compression = compression_for(fname or '', opts.pop('compression', 'auto'))
+            page_size = int(opts.pop('pagesize', self.export_page_size))
+            numprocesses = int(opts.pop('numprocesses', 1))
+            max_rows = opts.pop('maxoutputsize', None)
+            if max_rows is not None:
+                max_rows = int(max_rows)
+            max_bytes = opts.pop('maxoutputbytes', None)
+            if max_bytes is not None:
+                max_bytes = int(max_bytes)
+        except ValueError, e:
+            self.printerr('Invalid COPY TO option value: %s' % (e,))
+            return None
+        if page_size < 1:
+            self.printerr('PAGESIZE must be at least 1.')
+            return None
+        if (max_rows is not None and max_rows < 1) or (max_bytes is not None and max_bytes < 1):
+            self.printerr('MAXOUTPUTSIZE and MAXOUTPUTBYTES must be at least 1.')
+            return None
+        sharded = max_rows is not None or max_bytes is not None
         if dialect_options['quotechar'] == dialect_options['escapechar']:
             dialect_options['doublequote'] = True
             del dialect_options['escapechar']
@@ -1512,50 +2579,357 @@ class Shell(cmd.Cmd):
         if opts:
             self.printerr('Unrecognized COPY TO options: %s'
                           % ', '.join(opts.keys()))
-            return 0
+            return None
+        if compression is not None and fname is None:
+            self.printerr("COMPRESSION can't be used when exporting to STDOUT.")
+            return None
+        if sharded and fname is None:
+            self.printerr("MAXOUTPUTSIZE and MAXOUTPUTBYTES can't be used when exporting "
+                          "to STDOUT.")
+            return None
+        if sharded and not concatenate:
+            self.printerr("MAXOUTPUTSIZE and MAXOUTPUTBYTES can't be used with "
+                          "CONCATENATE=false.")
+            return None
+        if raw_encoding is not None and binary:
+            self.printerr("MODE='raw' can't be used with FORMAT='binary', which is raw already.")
+            return None
+
+        return dict(dialect=dialect_options, encoding=encoding, nullval=nullval,
+                    pagesize=page_size, binary=binary,
+                    # binary dumps always start with their columns and types
+                    header=header or binary,
+                    time_format=self.display_time_format,
+                    float_precision=self.display_float_precision,
+                    maxrows=max_rows, maxbytes=max_bytes, compression=compression,
+                    numprocesses=numprocesses, concatenate=concatenate, raw=raw_encoding)
 
+    def write_export(self, ks, cf, columns, fname, settings, write_rows):
+        """
+        Export to fname, or to STDOUT if that's None, from this process:
+        open the file (or files), write the header, and call
+        write_rows(writer, progress) to write the rows through the row
+        writer. Returns what write_rows does, the number of rows written.
+        """
+        sharded = settings['maxrows'] is not None or settings['maxbytes'] is not None
         if fname is None:
             do_close = False
             csvdest = sys.stdout
         else:
             do_close = True
             try:
-                csvdest = open(fname, 'wb')
+                if sharded:
+                    csvdest = self.open_export_shards(ks, cf, columns, fname,
+                                                      settings['compression'], settings)
+                else:
+                    csvdest = open_compressed(fname, 'wb', settings['compression'])
             except IOError, e:
                 self.printerr("Can't open %r for writing: %s" % (fname, e))
                 return 0
+        progress = None
+        if fname is not None and sys.stderr.isatty():
+            progress = ProgressReporter('Exported', position=csvdest.tell)
         try:
-            self.prep_export_dump(ks, cf, columns)
-            writer = csv.writer(csvdest, **dialect_options)
-            if header:
-                writer.writerow([d[0] for d in self.cursor.description])
-            rows = 0
-            while True:
-                row = self.cursor.fetchone()
-                if row is None:
-                    break
-                fmt = lambda v, t: \
-                    format_value(v, t, output_encoding=encoding, nullval=nullval,
-                                 time_format=self.display_time_format,
-                                 float_precision=self.display_float_precision).strval
-                writer.writerow(map(fmt, row, self.cursor.column_types))
-                rows += 1
+            if sharded:
+                writer = csvdest
+            else:
+                self.write_export_header(ks, cf, columns, csvdest, settings)
+                writer = self.export_writer(csvdest, settings)
+            return write_rows(writer, progress)
         finally:
+            if progress is not None:
+                progress.finish()
             if do_close:
                 csvdest.close()
+
+    def open_export_shards(self, ks, cf, columns, fname, compression, settings):
+        """
+        Return a ShardedOutput writing rows in place of fname, to files of
+        at most settings['maxrows'] rows or settings['maxbytes'] bytes, each
+        with its own header.
+        """
+        def open_writer(dest):
+            self.write_export_header(ks, cf, columns, dest, settings)
+            return self.export_writer(dest, settings)
+        return ShardedOutput(fname, compression, open_writer, settings['maxrows'],
+                             settings['maxbytes'])
+
+    def export_writer(self, dest, settings):
+        if settings['binary']:
+            return BinaryDumpWriter(dest)
+        return csv.writer(dest, **settings['dialect'])
+
+    def write_export_header(self, ks, cf, columns, dest, settings):
+        if not settings['header']:
+            return
+        if settings['binary']:
+            layout = self.get_columnfamily_layout(ks, cf)
+            BinaryDumpWriter(dest).writeheader(columns, [column_type(layout, name)
+                                                         for name in columns])
+        else:
+            csv.writer(dest, **settings['dialect']).writerow(columns)
+
+    def export_range(self, ks, cf, columns, writer, settings, start_token=None, end_token=None,
+                     progress=None):
+        """
+        Write the rows of the table with tokens after start_token and up to
+        end_token (by default, all of them) through writer, as made by
+        export_writer(). Returns the number of rows written.
+        """
+        if settings['binary'] or settings['raw'] is not None:
+            # skip decoding the values, and write them as they came
+            pager = self.prep_export_dump(ks, cf, columns, settings['pagesize'], start_token,
+                                          end_token, decoder=SerializedValueDecoder)
+        else:
+            pager = self.prep_export_dump(ks, cf, columns, settings['pagesize'], start_token,
+                                          end_token)
+        format_page = None
+        rows = 0
+        for page in pager.pages():
+            if format_page is None:
+                # the column types are only known once there are rows
+                format_page = self.export_page_formatter(pager.column_types, settings)
+            page = format_page(page)
+            writer.writerows(page)
+            rows += len(page)
+            if progress is not None:
+                progress.update(len(page))
         return rows
 
-    def prep_export_dump(self, ks, cf, columns):
+    def fetched_pages(self, settings):
+        """
+        Generate the rows of the query just executed, decoding
+        settings['pagesize'] of them at a time.
+        """
+        while True:
+            if settings['raw'] is not None:
+                page = serialized_rows(self.cursor, settings['pagesize'])
+            else:
+                page = self.cursor.fetchmany(settings['pagesize'])
+            if not page:
+                return
+            yield page
+
+    def export_query_rows(self, writer, coltypes, pages, settings, limit=None, progress=None):
+        """
+        Write the rows in pages, whose values have the given types, through
+        writer, a page at a time, stopping after limit rows if that's
+        given. Returns the number of rows written.
+        """
+        format_page = None
+        rows = 0
+        for page in pages:
+            if limit is not None:
+                page = page[:limit - rows]
+            if not page:
+                continue
+            if format_page is None:
+                format_page = self.export_page_formatter(coltypes, settings)
+            writer.writerows(format_page(page))
+            rows += len(page)
+            if progress is not None:
+                progress.update(len(page))
+            if limit is not None and rows >= limit:
+                break
+        return rows
+
+    def export_page_formatter(self, coltypes, settings):
+        """
+        Return a function turning a page of rows with values of the given
+        types into what export_writer()'s writer takes: the rows themselves
+        for binary dumps, encoded serialized values in raw mode, and
+        formatted values otherwise.
+        """
+        if settings['binary']:
+            return lambda page: page
+        if settings['raw'] is not None:
+            encode = raw_value_encoder(settings['raw'], settings['nullval'])
+            return lambda page: [map(encode, row) for row in page]
+        formatters = [value_formatter(t, settings['encoding'], nullval=settings['nullval'],
+                                      time_format=settings['time_format'],
+                                      float_precision=settings['float_precision'])
+                      for t in coltypes]
+        return lambda page: [[f(v).strval for (f, v) in zip(formatters, row)] for row in page]
+
+    def get_export_ranges(self, ks, numprocesses):
+        """
+        Split up the ring into (start, end, replicas) token ranges for
+        numprocesses export workers, several for each of them, or return
+        None if the ring can't be split.
+        """
+        try:
+            partitioner = self.get_partitioner()
+            token_map = TokenMap.from_ring(self.get_ring(ks))
+        except Exception, e:
+            if self.debug:
+                print "Can't get ring (%s); exporting through %s" % (e, self.hostname)
+            return None
+        if token_function(partitioner) is None or not token_map.end_tokens:
+            if self.debug:
+                print "Can't split up the ring of %s; exporting through %s" \
+                      % (partitioner, self.hostname)
+            return None
+        ringranges = token_map.ranges()
+        # round up, so there are at least export_tasks_per_process for each worker
+        splits = -(-numprocesses * self.export_tasks_per_process // len(ringranges))
+        ranges = []
+        for start, end, replicas in ringranges:
+            for substart, subend in split_token_range(start, end, splits, partitioner):
+                ranges.append((substart, subend, replicas))
+        # in token order, so that the joined-up parts are too
+        ranges.sort()
+        return ranges
+
+    def perform_csv_export_parallel(self, ks, cf, columns, fname, compression, settings, ranges,
+                                    numprocesses, concatenate=True):
+        """
+        Export the given (start, end, replicas) token ranges of the table
+        from numprocesses workers, each range to a part file of its own.
+        Unless concatenate is false, the parts are then joined up into fname,
+        in ring order, and removed, or spread over size-limited files if
+        settings['maxrows'] or settings['maxbytes'] is set. Otherwise they
+        are left as files of their own, with a header each, named after
+        fname. Returns the number of rows exported.
+        """
+        if concatenate:
+            try:
+                partdir = tempfile.mkdtemp(prefix='.%s-' % os.path.basename(fname),
+                                           dir=os.path.dirname(os.path.abspath(fname)))
+            except (IOError, OSError), e:
+                self.printerr("Can't create files next to %r: %s" % (fname, e))
+                return 0
+            partnames = [os.path.join(partdir, '%05d' % n) for n in range(len(ranges))]
+            # the parts only hold rows; we compress them as we join them up.
+            # Binary parts that will be read back row by row need their header
+            sharded = settings['maxrows'] is not None or settings['maxbytes'] is not None
+            part_settings = dict(settings, header=settings['binary'] and sharded,
+                                 compression=None)
+        else:
+            partnames = [part_filename(fname, n) for n in range(len(ranges))]
+            part_settings = dict(settings, compression=compression)
+        shell_args = dict(hostname=self.hostname, port=self.port,
+                          transport_factory=self.transport_factory,
+                          username=self.username, password=self.password,
+                          encoding=self.encoding, cqlver=self.cql_version, keyspace=ks)
+        inqueue = multiprocessing.Queue()
+        outqueue = multiprocessing.Queue()
+        for task in zip(partnames, ranges):
+            inqueue.put(task)
+        workers = []
+        progress = None
+        exported = {}
+        failed = False
+        # the parts are removed however we stop, even on a KeyboardInterrupt
+        try:
+            try:
+                for workerid in range(numprocesses):
+                    inqueue.put(None)
+                    worker = multiprocessing.Process(target=export_worker,
+                                                     args=(workerid, shell_args,
+                                                           self.cursor.consistency_level,
+                                                           self.debug, ks, cf, columns,
+                                                           part_settings, inqueue, outqueue))
+                    worker.daemon = True
+                    worker.start()
+                    workers.append(worker)
+
+                if sys.stderr.isatty():
+                    progress = ProgressReporter('Exported')
+                while len(exported) < len(workers):
+                    try:
+                        msg = outqueue.get(timeout=1)
+                    except Queue.Empty:
+                        if not any(w.is_alive() for w in workers):
+                            failed = True
+                            break
+                        if progress is not None:
+                            progress.update()
+                        continue
+                    kind, workerid = msg[:2]
+                    if kind == 'done':
+                        exported[workerid] = msg[2]
+                    elif kind == 'progress':
+                        if progress is not None:
+                            progress.update(msg[2])
+                    elif kind == 'error':
+                        if progress is not None:
+                            progress.finish()
+                        self.printerr('Worker #%d failed: %s' % (workerid, msg[2]))
+                        failed = True
+                        break
+            finally:
+                if progress is not None:
+                    progress.finish()
+                for worker in workers:
+                    if worker.is_alive() and len(exported) < len(workers):
+                        worker.terminate()
+                    worker.join()
+
+            if concatenate and not failed:
+                self.concatenate_export_parts(ks, cf, columns, fname, compression,
+                                              settings, partnames)
+        finally:
+            if concatenate:
+                shutil.rmtree(partdir, ignore_errors=True)
+        if failed:
+            return 0
+        if self.debug:
+            for workerid, rows in sorted(exported.items()):
+                print 'Worker #%d exported %d rows' % (workerid, rows)
+        return sum(exported.values())
+
+    def concatenate_export_parts(self, ks, cf, columns, fname, compression, settings, partnames):
+        if settings['maxrows'] is not None or settings['maxbytes'] is not None:
+            return self.shard_export_parts(ks, cf, columns, fname, compression, settings,
+                                           partnames)
+        dest = open_compressed(fname, 'wb', compression)
+        try:
+            self.write_export_header(ks, cf, columns, dest, settings)
+            for partname in partnames:
+                part = open(partname, 'rb')
+                try:
+                    shutil.copyfileobj(part, dest, COMPRESSION_BUFFER_SIZE)
+                finally:
+                    part.close()
+                os.remove(partname)
+        finally:
+            dest.close()
+
+    def shard_export_parts(self, ks, cf, columns, fname, compression, settings, partnames):
+        # the rows have to be read back to find where the files should end
+        dest = self.open_export_shards(ks, cf, columns, fname, compression, settings)
+        try:
+            for partname in partnames:
+                part = open(partname, 'rb')
+                try:
+                    if settings['binary']:
+                        rows = BinaryDumpReader(part)
+                    else:
+                        rows = csv.reader(part, **settings['dialect'])
+                    while True:
+                        page = list(itertools.islice(rows, settings['pagesize']))
+                        if not page:
+                            break
+                        dest.writerows(page)
+                finally:
+                    part.close()
+                os.remove(partname)
+        finally:
+            dest.close()
+
+    def prep_export_dump(self, ks, cf, columns, page_size, start_token=None, end_token=None,
+                         decoder=None):
+        """
+        Return a TokenPager over the given columns of the table, so that only
+        a page of rows is held in memory at a time.
+        """
         if columns is None:
             columns = self.get_column_names(ks, cf)
-        columnlist = ', '.join(self.cql_protect_names(columns))
-        # this limit is pretty awful. would be better to use row-key-paging, so
-        # that the dump could be pretty easily aborted if necessary, but that
-        # can be kind of tricky with cql3. Punt for now, until the real cursor
-        # API is added in CASSANDRA-4415.
-        query = 'SELECT %s FROM %s.%s LIMIT 99999999' \
-                % (columnlist, self.cql_protect_name(ks), self.cql_protect_name(cf))
-        self.cursor.execute(query)
+        layout = self.get_columnfamily_layout(ks, cf)
+        return TokenPager.from_layout(self.cursor, layout, self.cql_protect_names(columns),
+                                      page_size, self.cql_protect_name,
+                                      start_token=start_token, end_token=end_token,
+                                      decoder=decoder)
 
     def do_show(self, parsed):
         """
@@ -1621,7 +2995,8 @@ class Shell(cmd.Cmd):
                          color=self.color, encoding=self.encoding, stdin=f,
                          tty=False, use_conn=self.conn, cqlver=self.cql_version,
                          display_time_format=self.display_time_format,
-                         display_float_precision=self.display_float_precision)
+                         display_float_precision=self.display_float_precision,
+                         max_col_width=self.max_col_width)
         subshell.cmdloop()
         f.close()
 
@@ -1684,7 +3059,7 @@ class Shell(cmd.Cmd):
             return
         self.shunted_query_out = self.query_out
         self.shunted_color = self.color
-        self.query_out = f
+        self.query_out = BufferedOutput(f)
         self.color = False
         print 'Now capturing query output to %r.' % (fname,)
 
@@ -1772,6 +3147,138 @@ class Shell(cmd.Cmd):
             self.expand_enabled = False
             print 'Disabled expanded output.'
 
+    def do_paging(self, parsed):
+        """
+        PAGING [cqlsh only]
+
+          Enables or disables paging of SELECT results.
+
+        PAGING ON [<page_size>]
+
+          Shows the results of further SELECTs a page of rows (100 by
+          default) at a time, fetching each page as the one before is shown
+          rather than all of them up front, so there is no default LIMIT.
+          On a terminal, you're asked before each page after the first.
+          Queries using COUNT, DISTINCT or ORDER BY, or restricting the
+          token or the clustering columns, or only part of the partition
+          key, or the partition key with IN, are shown all at once as usual.
+
+        PAGING OFF
+
+          Disables paging.
+
+        PAGING
+
+          PAGING with no arguments shows the current paging status.
+        """
+        switch = parsed.get_binding('switch')
+        if switch is None:
+            if self.paging_enabled:
+                print "Paging is currently enabled, with a page size of %d. " \
+                      "Use PAGING OFF to disable" % (self.page_size,)
+            else:
+                print "Paging is currently disabled. Use PAGING ON to enable."
+            return
+
+        if switch.upper() == 'ON':
+            size = parsed.get_binding('size')
+            if size is not None:
+                if int(size) < 1:
+                    self.printerr('The page size must be at least 1.')
+                    return
+                self.page_size = int(size)
+            elif self.paging_enabled:
+                self.printerr('Paging is already enabled. Use PAGING OFF to disable.')
+                return
+            self.paging_enabled = True
+            print 'Now showing SELECT results in pages of %d rows.' % (self.page_size,)
+            return
+
+        if switch.upper() == 'OFF':
+            if not self.paging_enabled:
+                self.printerr('Paging is not enabled.')
+                return
+            self.paging_enabled = False
+            print 'Disabled paging.'
+
+    def do_more(self, parsed):
+        """
+        MORE [cqlsh only]
+
+          Shows the next rows of the last SELECT, when that stopped at the
+          default LIMIT of 10000 rows. Each MORE shows up to 10000 more,
+          picking up after the primary key of the last row shown, so the
+          rows already shown aren't read again. That makes it a way to walk
+          through a large table or partition without a huge LIMIT.
+
+        MORE <count>
+
+          Shows up to <count> more rows instead.
+
+          SELECTs using COUNT, DISTINCT, ORDER BY or IN, or restricting the
+          token, the clustering columns or only part of the partition key,
+          can't be continued this way.
+        """
+        if self.continuation is None:
+            self.printerr('There are no more rows to show.')
+            return
+        size = parsed.get_binding('size')
+        if size is None:
+            size = DEFAULT_SELECT_LIMIT
+        elif int(size) < 1:
+            self.printerr('The row count must be at least 1.')
+            return
+        if self.print_continued_select(self.continuation, int(size)) \
+                and self.continuation.exhausted:
+            self.continuation = None
+
+    def do_maxcolwidth(self, parsed):
+        """
+        MAXCOLWIDTH [cqlsh only]
+
+          Limits how wide a value is shown in query results.
+
+        MAXCOLWIDTH <width>
+
+          Cuts down values wider than <width> columns to fit, ending them in
+          "...". Only the part of a long string, blob or collection that
+          can show is formatted at all, so huge values are as quick to show
+          as short ones.
+
+        MAXCOLWIDTH OFF
+
+          Shows values whole, as by default.
+
+        MAXCOLWIDTH
+
+          MAXCOLWIDTH with no arguments shows the current limit.
+
+          The limit can also be set with max_col_width in the [ui] section
+          of cqlshrc.
+        """
+        width = parsed.get_binding('width')
+        if width is not None:
+            if int(width) <= len(TRUNCATION_MARKER):
+                self.printerr('The width must be at least %d.' % (len(TRUNCATION_MARKER) + 1,))
+                return
+            self.max_col_width = int(width)
+            print 'Now showing values up to %d columns wide.' % (self.max_col_width,)
+            return
+
+        if parsed.get_binding('switch') is not None:
+            if self.max_col_width is None:
+                self.printerr('Values are already shown whole.')
+                return
+            self.max_col_width = None
+            print 'Now showing values whole.'
+            return
+
+        if self.max_col_width is None:
+            print "Values are currently shown whole. Use MAXCOLWIDTH <width> to limit them."
+        else:
+            print "Values are currently limited to %d columns. " \
+                  "Use MAXCOLWIDTH OFF to show them whole." % (self.max_col_width,)
+
     def do_consistency(self, parsed):
         """
         CONSISTENCY [cqlsh only]
@@ -1859,12 +3366,127 @@ class Shell(cmd.Cmd):
 
     def printerr(self, text, color=RED, newline=True, shownum=None):
         self.statement_error = True
+        # keep errors in order with the query output before them
+        self.flush_output()
         if shownum is None:
             shownum = self.show_line_nums
         if shownum:
             text = '%s:%d:%s' % (self.stdin.name, self.lineno, text)
         self.writeresult(text, color, newline=newline, out=sys.stderr)
 
+def import_worker(workerid, shell_args, consistency_level, debug, ks, cf, columns,
+                  settings, inqueue, outqueue, abort):
+    """
+    Body of a COPY FROM worker process. Opens a new connection, then inserts
+    chunks of (rownum, linenum, row) records, or the records in parts of
+    settings['csvfile'], from inqueue until it sees None, reporting back
+    through outqueue.
+    """
+    # the parent takes care of interrupts and shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    rows = 0
+    try:
+        shell = Shell(tty=False, **shell_args)
+        shell.show_line_nums = False
+        shell.debug = debug
+        shell.cursor.consistency_level = consistency_level
+        # the parent counts up rejected rows and decides when to give up
+        errors = ImportErrorHandler(-1, settings['maxattempts'],
+                                    lambda batch, message: outqueue.put(('rejected', workerid,
+                                                                         batch, message)))
+        importer = shell.make_importer(ks, cf, columns, settings, errors)
+        acked = []
+        if settings.get('checkpoint'):
+            importer.on_finished = lambda batch: acked.extend(record[0] for record in batch)
+        try:
+            while True:
+                chunk = inqueue.get()
+                if chunk is None:
+                    break
+                read_failures = []
+                if 'csvfile' in settings:
+                    chunk = shell.read_import_file_part(settings['csvfile'], settings['dialect'],
+                                                        columns, chunk, read_failures)
+                imported, failure = importer.import_records(
+                        record for record in chunk if not abort.is_set())
+                rows += imported
+                outqueue.put(('progress', workerid, imported))
+                if failure is not None:
+                    read_failures.append(failure)
+                failure = min(read_failures) if read_failures else None
+                if acked:
+                    outqueue.put(('acked', workerid, acked[:]))
+                    del acked[:]
+                if failure is not None:
+                    outqueue.put(('failed', workerid, failure))
+                    abort.set()
+        finally:
+            importer.close()
+    except Exception, e:
+        outqueue.put(('error', workerid, str(e)))
+    finally:
+        outqueue.put(('done', workerid, rows))
+
+def export_worker(workerid, shell_args, consistency_level, debug, ks, cf, columns, settings,
+                  inqueue, outqueue):
+    """
+    Body of a COPY TO worker process. Exports the token ranges in the
+    (partname, (start, end, replicas)) tasks from inqueue, each to the part
+    file partname, until it sees None. Each range is read through a
+    connection to one of its replicas where possible.
+    """
+    # the parent takes care of interrupts and shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    rows = 0
+    shells = {}
+
+    def open_shell(host):
+        shell = Shell(tty=False, **dict(shell_args, hostname=host))
+        shell.show_line_nums = False
+        shell.debug = debug
+        shell.cursor.consistency_level = consistency_level
+        return shell
+
+    def shell_for(replicas):
+        # spread the workers over the replicas
+        offset = workerid % len(replicas) if replicas else 0
+        replicas = replicas[offset:] + replicas[:offset]
+        for host in replicas:
+            if host not in shells:
+                try:
+                    shells[host] = open_shell(host)
+                except Exception, e:
+                    shells[host] = None
+                    if debug:
+                        print "Can't connect to replica %s (%s); exporting through %s" \
+                              % (host, e, shell_args['hostname'])
+            if shells[host] is not None:
+                return shells[host]
+        if shells.get(shell_args['hostname']) is None:
+            shells[shell_args['hostname']] = open_shell(shell_args['hostname'])
+        return shells[shell_args['hostname']]
+
+    try:
+        while True:
+            task = inqueue.get()
+            if task is None:
+                break
+            partname, (start, end, replicas) = task
+            shell = shell_for(list(replicas))
+            dest = open_compressed(partname, 'wb', settings['compression'])
+            try:
+                shell.write_export_header(ks, cf, columns, dest, settings)
+                exported = shell.export_range(ks, cf, columns, shell.export_writer(dest, settings),
+                                              settings, start, end)
+            finally:
+                dest.close()
+            rows += exported
+            outqueue.put(('progress', workerid, exported))
+    except Exception, e:
+        outqueue.put(('error', workerid, str(e)))
+    finally:
+        outqueue.put(('done', workerid, rows))
+
 class ErrorHandlingSchemaDecoder(cql.decoders.SchemaDecoder):
     def name_decode_error(self, err, namebytes, expectedtype):
         return DecodeError(namebytes, err, expectedtype)
@@ -1937,6 +3559,12 @@ def read_options(cmdlineargs, environment):
                                                     DEFAULT_TIME_FORMAT)
     optvalues.float_precision = option_with_default(configs.getint, 'ui', 'float_precision',
                                                     DEFAULT_FLOAT_PRECISION)
+    optvalues.max_col_width = option_with_default(configs.getint, 'ui', 'max_col_width')
+    if optvalues.max_col_width is not None \
+            and optvalues.max_col_width <= len(TRUNCATION_MARKER):
+        sys.stderr.write("Warning: max_col_width in %s must be at least %d; "
+                         "showing values whole.\n" % (CONFIG_FILE, len(TRUNCATION_MARKER) + 1))
+        optvalues.max_col_width = None
     optvalues.debug = False
     optvalues.file = None
     optvalues.tty = sys.stdin.isatty()
@@ -2047,6 +3675,7 @@ def main(options, hostname, port):
                       keyspace=options.keyspace,
                       display_time_format=options.time_format,
                       display_float_precision=options.float_precision,
+                      max_col_width=options.max_col_width,
                       single_statement=options.execute)
     except KeyboardInterrupt:
         sys.exit('Connection aborted.')
@@ -0,0 +1,2083 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import binascii
+import bz2
+import calendar
+import csv
+import datetime
+import gzip
+import heapq
+import io
+import json
+import mmap
+import os
+import re
+import socket
+import struct
+import sys
+import time
+from collections import OrderedDict, deque
+from decimal import Decimal, InvalidOperation
+from uuid import UUID
+import cql
+from cql.cqltypes import ReversedType, CompositeType, lookup_casstype
+from cql.marshal import int64_pack
+from cql.decoders import SchemaDecoder
+from cql.query import PreparedQuery, prepare_query
+from cql.native import (PrepareMessage, ExecuteMessage, QueryMessage, ErrorMessage, read_frame,
+                        UnavailableExceptionErrorMessage, OverloadedErrorMessage,
+                        IsBootstrappingErrorMessage, RequestTimeoutException)
+
+# Mapping cql type base names ("int", "timestamp", etc) to functions which
+# turn a CSV field into the native value expected by that type's serializer.
+# Types with no entry here (collections, custom types) can only be imported
+# as CQL literals.
+_converters = {}
+
+def converter_for(typname):
+    def registrator(f):
+        _converters[typname] = f
+        return f
+    return registrator
+
+# Mapping cql type base names to functions serializing what the converter for
+# that type returns, where that isn't what the driver's own serializer takes.
+_serializers = {}
+
+def serializer_for(typname):
+    def registrator(f):
+        _serializers[typname] = f
+        return f
+    return registrator
+
+def value_serializer(cqltype):
+    """
+    Return a function serializing the converted values of cqltype.
+    """
+
+    if issubclass(cqltype, ReversedType):
+        cqltype = cqltype.subtypes[0]
+    serializer = _serializers.get(cqltype.typename)
+    if serializer is not None:
+        return serializer
+    return lambda val: cqltype.to_binary(cqltype.validate(val))
+
+@converter_for('ascii')
+def convert_bytes(val):
+    return val
+
+@converter_for('inet')
+def convert_inet(val):
+    """
+    Check that an inet field is a plain IPv4 or IPv6 address, which is how
+    the serializer will read it. Anything else (host names, or the short
+    forms inet_aton() reads differently than Cassandra) raises ValueError.
+
+    >>> convert_inet('10.0.0.1')
+    '10.0.0.1'
+    >>> convert_inet('10.1')
+    Traceback (most recent call last):
+      ...
+    ValueError: '10.1' is not an IP address
+    """
+
+    family = socket.AF_INET6 if ':' in val else socket.AF_INET
+    try:
+        socket.inet_pton(family, val)
+    except (socket.error, ValueError):
+        raise ValueError('%r is not an IP address' % (val,))
+    return val
+
+@converter_for('text')
+@converter_for('varchar')
+def convert_text(val):
+    return val.decode('utf8')
+
+@converter_for('blob')
+def convert_blob(val):
+    if val[:2].lower() == '0x':
+        val = val[2:]
+    return binascii.unhexlify(val)
+
+def check_range(value, low, high, typname):
+    if not low <= value <= high:
+        raise ValueError('%r is out of range for %s' % (value, typname))
+    return value
+
+@converter_for('int')
+def convert_int(val):
+    return check_range(int(val), -2 ** 31, 2 ** 31 - 1, 'int')
+
+@converter_for('bigint')
+@converter_for('counter')
+def convert_bigint(val):
+    return check_range(int(val), -2 ** 63, 2 ** 63 - 1, 'bigint')
+
+@converter_for('varint')
+def convert_varint(val):
+    return int(val)
+
+# largest finite single-precision float
+MAX_FLOAT = 3.4028234663852886e+38
+
+@converter_for('float')
+def convert_float(val):
+    value = float(val)
+    if abs(value) > MAX_FLOAT and value not in (float('inf'), float('-inf')):
+        raise ValueError('%r is out of range for float' % (value,))
+    return value
+
+@converter_for('double')
+def convert_double(val):
+    return float(val)
+
+@converter_for('decimal')
+def convert_decimal(val):
+    """
+    >>> convert_decimal('1.50')
+    Decimal('1.50')
+    >>> convert_decimal('abc')
+    Traceback (most recent call last):
+      ...
+    ValueError: 'abc' is not a decimal
+    """
+
+    try:
+        value = Decimal(val)
+    except InvalidOperation:
+        raise ValueError('%r is not a decimal' % (val,))
+    if not value.is_finite():
+        # NaN and infinities can't be serialized
+        raise ValueError('%r is not a finite decimal' % (val,))
+    return value
+
+@converter_for('boolean')
+def convert_boolean(val):
+    lowered = val.lower()
+    if lowered not in ('true', 'false'):
+        raise ValueError("%r is not a boolean" % (val,))
+    return lowered == 'true'
+
+@converter_for('uuid')
+@converter_for('timeuuid')
+def convert_uuid(val):
+    return UUID(val)
+
+# Date strings whose instant can be worked out here: the forms Cassandra
+# reads, with milliseconds given as exactly three digits (as Cassandra reads
+# any other number of digits as a count of milliseconds) and an explicit
+# timezone offset.
+_timestamp_re = re.compile(r'(\d{4})-(\d\d)-(\d\d)'
+                           r'(?:[ T](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{3}))?)?)?'
+                           r'([+-])(\d\d):?(\d\d)$')
+
+@converter_for('timestamp')
+def convert_timestamp(val):
+    """
+    Read a timestamp field as an integer count of milliseconds since the
+    epoch, for serialize_timestamp() to write out exactly. Dates without a
+    timezone are in the timezone of the Cassandra node, which can't be
+    known here, so they raise ValueError like any other value which has to
+    be left for Cassandra to interpret.
+
+    >>> convert_timestamp('1367409600123')
+    1367409600123
+    >>> convert_timestamp('2013-05-01 14:00:00.123+0200')
+    1367409600123
+    >>> convert_timestamp('2013-05-01T12:00+00:00')
+    1367409600000
+    >>> convert_timestamp('2013-05-01 12:00:00')
+    Traceback (most recent call last):
+      ...
+    ValueError: can't interpret '2013-05-01 12:00:00' as a timestamp here
+    """
+
+    if val.lstrip('-').isdigit():
+        # milliseconds since the epoch, same as a CQL integer literal
+        millis = int(val)
+    else:
+        match = _timestamp_re.match(val)
+        if match is None:
+            raise ValueError("can't interpret %r as a timestamp here" % (val,))
+        (year, month, day, hour, minute, second, fraction,
+         sign, offset_hours, offset_minutes) = match.groups()
+        moment = datetime.datetime(int(year), int(month), int(day), int(hour or 0),
+                                   int(minute or 0), int(second or 0))
+        offset = int(offset_hours) * 60 + int(offset_minutes)
+        if sign == '-':
+            offset = -offset
+        millis = (calendar.timegm(moment.timetuple()) - offset * 60) * 1000 + int(fraction or 0)
+    if not -2 ** 63 <= millis < 2 ** 63:
+        raise ValueError('timestamp %r out of range' % (val,))
+    return millis
+
+@serializer_for('timestamp')
+def serialize_timestamp(millis):
+    """
+    Serialize milliseconds since the epoch, as convert_timestamp() returns
+    them. The driver's DateType takes seconds, and multiplies them back up
+    without ever making an integer of them.
+
+    >>> serialize_timestamp(1367409600123)
+    '\\x00\\x00\\x01>_\\xf6\\xa6{'
+    """
+
+    return int64_pack(millis)
+
+# What converting a bad field, or serializing what it was converted to,
+# can raise. Rows failing with these are left for Cassandra to interpret.
+CONVERSION_ERRORS = (ValueError, TypeError, OverflowError, struct.error)
+
+# Cassandra warns about batches larger than this (batch_size_warn_threshold),
+# so stop adding rows to a batch once its fields add up to this many bytes.
+MAX_BATCH_BYTES = 5 * 1024
+
+# How many partitions may have a batch filling at once before the oldest one
+# is sent regardless of its size.
+MAX_OPEN_BATCHES = 32
+
+def group_into_batches(records, partition_key, max_batch_size,
+                       max_batch_bytes=MAX_BATCH_BYTES, nullmask=None, primary_key=None):
+    """
+    Group (rownum, linenum, row) records into lists of records sharing a
+    partition, as determined by partition_key(row), of no more than
+    max_batch_size records and (unless a single row is bigger) no more than
+    max_batch_bytes of field data. If partition_key is None every record
+    goes in a batch of its own.
+
+    If nullmask is given, the records in a batch also share nullmask(row),
+    so that they can all be bound to the same prepared statement. The rows
+    of an UNLOGGED BATCH all get the same timestamp, so of two rows for the
+    same primary key in one batch it would be up to Cassandra which one
+    wins. A record whose primary_key(row) fields are the same as those of
+    one in any batch still being filled (if primary_key is given) therefore
+    sends that batch off first, so that later rows overwrite earlier ones.
+
+    >>> records = [(n, n, row) for (n, row) in enumerate(['1a', '1b', '1a', '2b', '1', '1b'])]
+    >>> for batch in group_into_batches(records, lambda row: row[0], 20,
+    ...                                 nullmask=lambda row: len(row) < 2,
+    ...                                 primary_key=lambda row: row):
+    ...     print [row for (_, _, row) in batch]
+    ['1a', '1b']
+    ['1a', '1b']
+    ['2b']
+    ['1']
+
+    That holds for rows with different null fields too, which go in
+    different batches:
+
+    >>> records = [(n, n, row) for (n, row) in enumerate([['1', 'a', ''], ['1', 'b', 'x'],
+    ...                                                   ['1', 'a', 'y']])]
+    >>> for batch in group_into_batches(records, lambda row: row[0], 2,
+    ...                                 nullmask=lambda row: tuple(not f for f in row),
+    ...                                 primary_key=lambda row: tuple(row[:2])):
+    ...     print [row for (_, _, row) in batch]
+    [['1', 'a', '']]
+    [['1', 'b', 'x'], ['1', 'a', 'y']]
+    """
+    if partition_key is None or max_batch_size <= 1:
+        for record in records:
+            yield [record]
+        return
+    open_batches = OrderedDict()
+    # the key of the open batch holding each primary key
+    batch_keys = {}
+
+    def close(key):
+        batch, size, rowkeys = open_batches.pop(key)
+        for rowkey in rowkeys:
+            del batch_keys[rowkey]
+        return batch
+
+    for record in records:
+        row = record[2]
+        key = partition_key(row)
+        if nullmask is not None:
+            key = (key, nullmask(row))
+        # fields of binary dumps are None when null
+        size = sum([len(field) for field in row if field])
+        rowkey = primary_key(row) if primary_key is not None else None
+        if rowkey in batch_keys:
+            yield close(batch_keys[rowkey])
+        pending = open_batches.get(key)
+        if pending is not None and pending[1] + size > max_batch_bytes:
+            yield close(key)
+            pending = None
+        if pending is None:
+            pending = open_batches[key] = [[], 0, set()]
+        pending[0].append(record)
+        pending[1] += size
+        if rowkey is not None:
+            pending[2].add(rowkey)
+            batch_keys[rowkey] = key
+        if len(pending[0]) >= max_batch_size:
+            yield close(key)
+        elif len(open_batches) > MAX_OPEN_BATCHES:
+            yield close(next(iter(open_batches)))
+    for batch, size, rowkeys in open_batches.itervalues():
+        yield batch
+
+# Size of the buffers put in front of compressed files, so that the csv
+# module's small reads and writes don't each go through the (de)compressor.
+COMPRESSION_BUFFER_SIZE = 1024 * 1024
+
+COMPRESSION_TYPES = ('gzip', 'bz2')
+
+_compression_suffixes = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.bz2': 'bz2',
+}
+
+def compression_for(fname, compression='auto'):
+    """
+    Work out the compression to use for the named file from a COMPRESSION
+    option value: 'auto' picks one from the file extension, 'none' means the
+    file is plain. Returns None for uncompressed files.
+
+    >>> compression_for('/tmp/ks.cf.csv.gz')
+    'gzip'
+    >>> compression_for('/tmp/ks.cf.csv.gz', 'none') is None
+    True
+    """
+
+    compression = compression.lower()
+    if compression == 'auto':
+        return _compression_suffixes.get(os.path.splitext(fname)[1].lower())
+    if compression == 'none':
+        return None
+    if compression not in COMPRESSION_TYPES:
+        raise ValueError('unknown compression %r (use one of: auto, none, %s)'
+                         % (compression, ', '.join(COMPRESSION_TYPES)))
+    return compression
+
+def _numbered_filename(fname, label):
+    base, suffix = os.path.splitext(fname)
+    if suffix.lower() not in _compression_suffixes:
+        base, suffix = fname, ''
+    base, ext = os.path.splitext(base)
+    return '%s.%s%s%s' % (base, label, ext, suffix)
+
+def part_filename(fname, index):
+    """
+    Name the index'th of a set of files which together hold what would
+    have gone in fname.
+
+    >>> part_filename('/tmp/ks.cf.csv.gz', 3)
+    '/tmp/ks.cf.part00003.csv.gz'
+    """
+
+    return _numbered_filename(fname, 'part%05d' % index)
+
+def shard_filename(fname, index):
+    """
+    Name the index'th (counting from 1) of the size-limited files written in
+    place of fname.
+
+    >>> shard_filename('/tmp/ks.cf.csv.gz', 1)
+    '/tmp/ks.cf.0001.csv.gz'
+    """
+
+    return _numbered_filename(fname, '%04d' % index)
+
+def shard_index_filename(fname):
+    """
+    Name the file listing the size-limited files written in place of fname.
+
+    >>> shard_index_filename('/tmp/ks.cf.csv.gz')
+    '/tmp/ks.cf.csv.index'
+    """
+
+    base, suffix = os.path.splitext(fname)
+    if suffix.lower() not in _compression_suffixes:
+        base = fname
+    return base + '.index'
+
+def open_compressed(fname, mode, compression=None):
+    """
+    Open fname in mode ('rb' or 'wb') as a file object reading or writing
+    through the given compression, or a plain file when compression is None.
+    """
+
+    if compression is None:
+        return open(fname, mode)
+    if compression == 'bz2':
+        return bz2.BZ2File(fname, mode, COMPRESSION_BUFFER_SIZE)
+    f = gzip.GzipFile(fname, mode)
+    if 'r' in mode:
+        return io.BufferedReader(f, COMPRESSION_BUFFER_SIZE)
+    return io.BufferedWriter(f, COMPRESSION_BUFFER_SIZE)
+
+class ShardedOutput(object):
+    """
+    Row writer spreading rows over a series of files named after fname by
+    shard_filename(), moving on to the next file once max_rows rows or
+    max_bytes bytes (before any compression) have gone into the current
+    one. Files never end part way through a row. open_writer(f) is called
+    with each new file to write any header and return a writer for its
+    rows. The first file is opened straight away, so that even an empty
+    export leaves its header behind.
+
+    close() writes an index of the files and how many rows each holds, as
+    CSV lines, to shard_index_filename(fname).
+    """
+
+    def __init__(self, fname, compression, open_writer, max_rows=None, max_bytes=None):
+        self.fname = fname
+        self.compression = compression
+        self.open_writer = open_writer
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.f = None
+        self.writer = None
+        self.rows = 0
+        self.closed_bytes = 0
+        self.next_shard()
+
+    def next_shard(self):
+        self.close_shard()
+        fname = shard_filename(self.fname, len(self.shards) + 1)
+        self.f = open_compressed(fname, 'wb', self.compression)
+        self.shards.append([fname, 0])
+        self.writer = self.open_writer(self.f)
+
+    def close_shard(self):
+        if self.f is not None:
+            self.closed_bytes += self.f.tell()
+            self.f.close()
+            self.f = None
+
+    def full(self):
+        return ((self.max_rows is not None and self.shards[-1][1] >= self.max_rows)
+                or (self.max_bytes is not None and self.f.tell() >= self.max_bytes))
+
+    def writerows(self, rows):
+        start = 0
+        while start < len(rows):
+            if self.full():
+                self.next_shard()
+            end = len(rows)
+            if self.max_rows is not None:
+                end = min(end, start + self.max_rows - self.shards[-1][1])
+            if self.max_bytes is None:
+                self.writer.writerows(rows[start:end])
+                self.shards[-1][1] += end - start
+                start = end
+                continue
+            # the only way to know when a file is full is to look after each row
+            while start < end and self.f.tell() < self.max_bytes:
+                self.writer.writerow(rows[start])
+                self.shards[-1][1] += 1
+                start += 1
+        self.rows += len(rows)
+
+    def tell(self):
+        if self.f is None:
+            return self.closed_bytes
+        return self.closed_bytes + self.f.tell()
+
+    def close(self):
+        self.close_shard()
+        index = open(shard_index_filename(self.fname), 'wb')
+        try:
+            for fname, rows in self.shards:
+                index.write('%s,%d\n' % (os.path.basename(fname), rows))
+        finally:
+            index.close()
+
+class OffsetTrackingReader(object):
+    """
+    Line iterator over a file which keeps count of the byte offset just past
+    the last line handed out. Plain file iteration reads ahead, so tell()
+    can't be used for this.
+    """
+
+    def __init__(self, f, offset=0):
+        self.f = f
+        self.offset = offset
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line
+
+    def tell(self):
+        return self.offset
+
+    def close(self):
+        self.f.close()
+
+def csv_record_ends(data, start, end, delimiter=',', quotechar='"', escapechar=None,
+                    doublequote=True):
+    """
+    Generate the offsets just past each record of the CSV data in
+    data[start:end] (a string or mmap, with start at the start of a record),
+    as a csv reader with the given dialect options reads them. Only the
+    quote, escape and newline characters are looked at.
+
+    A quote character only opens a quoted field at the start of the field;
+    anywhere else it is taken literally. An escape character takes the next
+    character literally, even another escape character, except that a
+    newline outside quotes still ends the record (the csv module reads a
+    line at a time):
+
+    >>> data = '1,5" screen,"a\\n"\\n2,//",b/\\n3,"c/"\\n",d'
+    >>> list(csv_record_ends(data, 0, len(data), escapechar='/', doublequote=False))
+    [17, 26, 36]
+    >>> for row in csv.reader(data.splitlines(True), escapechar='/', doublequote=False):
+    ...     print row
+    ['1', '5" screen', 'a\\n']
+    ['2', '/"', 'b\\n']
+    ['3', 'c"\\n', 'd']
+    """
+
+    def find(char, pos):
+        found = data.find(char, pos, end)
+        return end if found < 0 else found
+
+    pos = recordstart = start
+    # the offset of the last character taken literally after an escape
+    escaped = -1
+    nextquote = nextnewline = start - 1
+    nextescape = start - 1 if escapechar is not None else end
+    while pos < end:
+        if nextquote < pos:
+            nextquote = find(quotechar, pos)
+        if nextescape < pos:
+            nextescape = find(escapechar, pos)
+        if nextnewline < pos:
+            nextnewline = find('\n', pos)
+        special = min(nextquote, nextescape, nextnewline)
+        if special >= end:
+            break
+        pos = special + 1
+        if special == nextnewline:
+            yield pos
+            recordstart = pos
+        elif special == nextescape:
+            if data[pos:pos + 1] not in ('\n', ''):
+                escaped = pos
+                pos += 1
+        elif special == recordstart or (data[special - 1] in (delimiter, '\n')
+                                        and special - 1 != escaped):
+            # a quoted field: find the quote closing it
+            while True:
+                closing = data.find(quotechar, pos, end)
+                if escapechar is not None:
+                    escape = data.find(escapechar, pos, end if closing < 0 else closing)
+                    if escape >= 0:
+                        pos = escape + 2
+                        continue
+                if closing < 0:
+                    pos = end
+                elif doublequote and data[closing + 1:closing + 2] == quotechar:
+                    pos = closing + 2
+                    continue
+                else:
+                    pos = closing + 1
+                break
+    if recordstart < end:
+        yield end
+
+def csv_symbol_table(delimiter, quotechar, escapechar=None):
+    """
+    Build the translation table for _newlines_end_records(), mapping the
+    quote, delimiter, escape and newline characters to '"', ',', '\\' and
+    '\\n', and everything else to 'x'.
+    """
+
+    table = ['x'] * 256
+    if escapechar is not None:
+        table[ord(escapechar)] = '\\'
+    table[ord(delimiter)] = ','
+    table[ord(quotechar)] = '"'
+    table[ord('\n')] = '\n'
+    return ''.join(table)
+
+_escaped_char_re = re.compile(r'\\[^\n]')
+
+# _newlines_end_records() goes over this much data at a time, which keeps
+# each of its passes over the data in the processor's caches.
+SCAN_BLOCK_SIZE = 64 * 1024
+
+def _newlines_end_records(data, symbols, doublequote=True):
+    """
+    Check cheaply that every newline in the CSV data (a string starting at
+    the start of a record) ends a record. Every character is first mapped
+    through the translation table symbols from csv_symbol_table(). After
+    escaped characters, and with doublequote pairs of quotes, are taken out,
+    a quote at the start of a field opens a quoted field, or closes one, and
+    any other quote leaves the data outside quotes, so no newline can be
+    inside quotes if no line has its last quote at the start of a field.
+
+    >>> symbols = csv_symbol_table(',', '"', '/')
+    >>> _newlines_end_records('1,"a, b",c\\n2,x"y,/"\\n', symbols)
+    True
+    >>> _newlines_end_records('1,"a\\n b",c\\n', symbols)
+    False
+    >>> _newlines_end_records('1,"a""\\n b",c\\n', symbols)
+    False
+    """
+
+    start = 0
+    while start < len(data):
+        newline = data.find('\n', start + SCAN_BLOCK_SIZE - 1)
+        end = len(data) if newline < 0 else newline + 1
+        block = '\n' + data[start:end].translate(symbols)
+        if '\\' in block:
+            block = _escaped_char_re.sub('xx', block)
+        if doublequote:
+            block = block.replace('""', '')
+        block = block.replace(',"', ',\x01').replace('\n"', '\n\x01').translate(None, 'x,\\')
+        if '\x01\n' in block or block.endswith('\x01'):
+            return False
+        start = end
+    return True
+
+def split_csv_file(f, start, chunk_size, **dialect):
+    """
+    Split up the CSV data in the file f, from offset start onwards, into
+    byte ranges of about chunk_size bytes which end on record boundaries,
+    as a csv reader with the given dialect options sees them. Generates
+    (start, end, records, lines) tuples giving the number of records and
+    lines in each.
+
+    The file is memory-mapped. Ranges are split at the first newline after
+    chunk_size bytes, unless _newlines_end_records() can't tell that no
+    newline in them is inside quotes; only those are scanned through with
+    csv_record_ends() to find where their last record ends:
+
+    >>> import tempfile
+    >>> f = tempfile.TemporaryFile()
+    >>> f.write('1,5" screen,a\\n2,"multi\\nline",b\\n3,c,d\\n')
+    >>> f.flush()
+    >>> for start, end, records, lines in split_csv_file(f, 0, 20, escapechar='\\\\',
+    ...                                                  doublequote=False):
+    ...     print start, end, records, lines
+    0 31 2 3
+    31 37 1 1
+    """
+
+    size = os.fstat(f.fileno()).st_size
+    if start >= size:
+        return
+    delimiter = dialect.get('delimiter', ',')
+    quotechar = dialect.get('quotechar', '"')
+    escapechar = dialect.get('escapechar')
+    doublequote = dialect.get('doublequote', True)
+    symbols = csv_symbol_table(delimiter, quotechar, escapechar)
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        while start < size:
+            newline = mapped.find('\n', min(start + chunk_size, size) - 1)
+            end = size if newline < 0 else newline + 1
+            data = mapped[start:end]
+            if quotechar in data and not _newlines_end_records(data, symbols, doublequote):
+                records = 0
+                for recordend in csv_record_ends(mapped, start, size, delimiter, quotechar,
+                                                 escapechar, doublequote):
+                    records += 1
+                    if recordend >= end:
+                        break
+                end = recordend
+                data = mapped[start:end]
+                lines = data.count('\n') + (0 if data.endswith('\n') else 1)
+            else:
+                records = lines = data.count('\n') + (0 if data.endswith('\n') else 1)
+            yield start, end, records, lines
+            start = end
+    finally:
+        mapped.close()
+
+class ImportCheckpoint(object):
+    """
+    Keeps track of how far into a COPY FROM input file every record has been
+    imported, and saves that position (byte offset, record count and line
+    number) to a file every save_interval seconds, so an interrupted import
+    can pick up where it left off.
+
+    Records are acknowledged out of order by pipelined and parallel imports,
+    so the position only moves past records once all the earlier ones are
+    acknowledged too. It is only known for the records passed through
+    track(), or announced by expect(), and moves from one to the next.
+    """
+
+    save_interval = 5
+
+    def __init__(self, filename, source, offset=0, rownum=0, linenum=0):
+        self.filename = filename
+        self.source = source
+        self.position = self.saved_position = (offset, rownum, linenum)
+        self.nextrow = rownum
+        self.last_saved = time.time()
+        self.pending = {}
+        self.acknowledged = set()
+
+    @classmethod
+    def load(cls, filename, source):
+        """
+        Read a saved checkpoint. Raises IOError if it can't be read, and
+        ValueError if it is damaged or was saved for some other input file.
+        """
+        f = open(filename)
+        try:
+            state = json.load(f)
+        finally:
+            f.close()
+        if state['source'] != source:
+            raise ValueError('checkpoint is for %r, not %r' % (state['source'], source))
+        return cls(filename, source, state['offset'], state['rownum'], state['linenum'])
+
+    def track(self, records, reader):
+        """
+        Pass (rownum, linenum, row) records through, noting the offset
+        reached in reader (an OffsetTrackingReader) by the end of each one.
+        """
+        for record in records:
+            self.pending[record[0]] = (reader.offset, record[1])
+            yield record
+
+    def expect(self, rownum, offset, linenum):
+        """
+        Note that record rownum ends at the given offset and line, for input
+        read somewhere else.
+        """
+        self.pending[rownum] = (offset, linenum)
+
+    def acknowledge(self, rownums):
+        acknowledged = self.acknowledged
+        acknowledged.update(rownums)
+        nextrow = self.nextrow
+        if nextrow not in acknowledged:
+            return
+        while nextrow in acknowledged:
+            acknowledged.remove(nextrow)
+            position = self.pending.pop(nextrow, None)
+            nextrow += 1
+            if position is not None:
+                self.position = (position[0], nextrow, position[1])
+        self.nextrow = nextrow
+        if time.time() - self.last_saved >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if self.position == self.saved_position:
+            return
+        offset, rownum, linenum = self.position
+        tmpname = self.filename + '.tmp'
+        f = open(tmpname, 'w')
+        try:
+            json.dump(dict(source=self.source, offset=offset, rownum=rownum,
+                           linenum=linenum), f)
+        finally:
+            f.close()
+        # rename() replaces the old checkpoint atomically, so a crash
+        # leaves either it or the new one intact
+        os.rename(tmpname, self.filename)
+        self.saved_position = self.position
+        self.last_saved = time.time()
+
+def column_type(layout, name):
+    """
+    The type of the named column of a CqlTableDef, without any ReversedType
+    wrapper.
+    """
+
+    cqltype = layout.get_column(name).cqltype
+    if issubclass(cqltype, ReversedType):
+        cqltype = cqltype.subtypes[0]
+    return cqltype
+
+def null_literal(layout, name, cqltype):
+    """
+    The CQL literal to insert for a null value in the named column. Clustering
+    columns can't be null, so those get an empty value, which has to be cast
+    from a blob for types with no empty literal of their own.
+    """
+
+    if name in layout.clustering_key_columns and not cqltype.empty_binary_ok:
+        return blob_literal(cqltype, '')
+    return 'null'
+
+def blob_literal(cqltype, valbytes):
+    """
+    Write a value of cqltype, as Cassandra serialized it, as a CQL literal
+    casting it back from a blob, which reproduces it exactly whatever its
+    type.
+
+    >>> blob_literal(lookup_casstype('Int32Type'), '\\x00\\x00\\x00\\x07')
+    'blobAsInt(0x00000007)'
+    """
+
+    return 'blobAs%s(0x%s)' % (cqltype.cql_parameterized_type().title(),
+                               binascii.hexlify(valbytes))
+
+class SerializedValueDecoder(SchemaDecoder):
+    """
+    Decoder leaving column values as the bytes Cassandra sent, for binary
+    dumps.
+    """
+
+    def decode_value(self, valbytes, vtype, colname):
+        return valbytes
+
+def serialized_rows(cursor, count=None):
+    """
+    Take up to count (by default, all) of the rows left in cursor's result
+    as lists of the values as Cassandra sent them, without going through
+    the decoder at all.
+    """
+
+    end = len(cursor.result) if count is None else cursor.rs_idx + count
+    rows = map(cursor.columnvalues, cursor.result[cursor.rs_idx:end])
+    cursor.rs_idx += len(rows)
+    return rows
+
+RAW_ENCODINGS = ('hex', 'base64')
+
+def raw_value_encoder(encoding, nullval):
+    """
+    Return a function writing a serialized value out as text in the given
+    encoding (one of RAW_ENCODINGS), or as nullval for None.
+
+    >>> raw_value_encoder('hex', '')('\\x00\\xff')
+    '00ff'
+    >>> raw_value_encoder('base64', 'null')(None)
+    'null'
+    """
+
+    if encoding == 'hex':
+        encode = binascii.hexlify
+    elif encoding == 'base64':
+        encode = base64.b64encode
+    else:
+        raise ValueError('unknown raw encoding %r (use one of: %s)'
+                         % (encoding, ', '.join(RAW_ENCODINGS)))
+
+    def encode_value(value):
+        if value is None:
+            return nullval
+        return encode(value)
+    return encode_value
+
+# A binary dump starts with BINARY_DUMP_MAGIC, then the number of columns as
+# an unsigned short, then the name and the (fully-qualified Cassandra) type
+# of each column, as unsigned short lengths followed by UTF-8 strings. Each
+# row follows as its column values in order, every one a signed int length
+# followed by that many bytes of serialized value; a length of -1 is a null.
+BINARY_DUMP_MAGIC = 'CQLSH-BINARY-DUMP 1\n'
+
+_short = struct.Struct('>H')
+_int = struct.Struct('>i')
+_null_value = _int.pack(-1)
+
+class BinaryDumpWriter(object):
+    """
+    Writes rows of serialized values (None for nulls) to a binary dump in
+    the file f. The header comes first, from writeheader().
+    """
+
+    def __init__(self, f):
+        self.f = f
+
+    def writeheader(self, columns, coltypes):
+        """
+        Write the header for the given columns, with their CassandraType
+        classes.
+        """
+
+        header = [BINARY_DUMP_MAGIC, _short.pack(len(columns))]
+        for name, coltype in zip(columns, coltypes):
+            for string in (name.encode('utf8'), coltype.cass_parameterized_type(full=True)):
+                header.append(_short.pack(len(string)) + string)
+        self.f.write(''.join(header))
+
+    def writerow(self, values):
+        self.f.write(''.join([_null_value if value is None else _int.pack(len(value)) + value
+                              for value in values]))
+
+    def writerows(self, rows):
+        for values in rows:
+            self.writerow(values)
+
+class BinaryDumpReader(object):
+    """
+    Reads the header of the binary dump in the file f, leaving its column
+    names in columns and their types in coltypes, and then iterates over its
+    rows as lists of serialized values, with None for nulls. Like a csv
+    reader, line_num counts the rows read so far.
+
+    Raises ValueError if the file isn't a binary dump or is cut short.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.line_num = 0
+        if f.read(len(BINARY_DUMP_MAGIC)) != BINARY_DUMP_MAGIC:
+            raise ValueError('not a cqlsh binary dump')
+        ncolumns, = _short.unpack(self.read(_short.size))
+        self.columns = []
+        self.coltypes = []
+        for n in range(ncolumns):
+            self.columns.append(self.read(*_short.unpack(self.read(_short.size))).decode('utf8'))
+            self.coltypes.append(lookup_casstype(self.read(*_short.unpack(self.read(_short.size)))))
+
+    def read(self, size):
+        data = self.f.read(size)
+        if len(data) < size:
+            raise ValueError('binary dump is truncated')
+        return data
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        read = self.f.read
+        row = []
+        for n in xrange(len(self.columns)):
+            data = read(_int.size)
+            if not data and n == 0:
+                raise StopIteration
+            if len(data) < _int.size:
+                raise ValueError('binary dump is truncated')
+            length, = _int.unpack(data)
+            row.append(None if length < 0 else self.read(length))
+        self.line_num += 1
+        return row
+
+def token_literal(token):
+    """
+    Write a partition token, as decoded from a token() column, as a CQL
+    literal: a number for the hashing partitioners, a string or a blob for
+    the order-preserving ones.
+
+    >>> token_literal(-4069959284402364209)
+    '-4069959284402364209'
+    >>> token_literal('\\x01\\xff')
+    '0x01ff'
+    """
+
+    if isinstance(token, (int, long)):
+        return str(token)
+    if isinstance(token, unicode):
+        return "'%s'" % token.encode('utf8').replace("'", "''")
+    return '0x' + binascii.hexlify(token)
+
+def key_info(layout, protect_name):
+    """
+    Return the quoted keyspace and table names of a CqlTableDef, its quoted
+    partition and clustering key column names, the types of those columns,
+    and whether each clustering column is in descending order.
+    """
+
+    if issubclass(layout.comparator, CompositeType):
+        clustering_types = layout.comparator.subtypes
+    else:
+        clustering_types = [layout.comparator]
+    descending = [issubclass(cqltype, ReversedType) for (name, cqltype)
+                  in zip(layout.clustering_key_columns, clustering_types)]
+    keys = layout.partition_key_columns + layout.clustering_key_columns
+    return (protect_name(layout.keyspace_name), protect_name(layout.columnfamily_name),
+            map(protect_name, layout.partition_key_columns),
+            map(protect_name, layout.clustering_key_columns),
+            [column_type(layout, name) for name in keys], descending)
+
+class TokenPager(object):
+    """
+    Iterates over the rows of a table by token order, page_size rows at a
+    time, instead of with one huge SELECT. Each page picks up with the
+    tokens after the last one on the page before. A full page may stop
+    part way through its last partition, so the rest of that partition is
+    read a page at a time by a KeyContinuation before moving on.
+
+    Only the rows with tokens after start_token and up to end_token are
+    read, if those are given, and only those matching the CQL relations in
+    where, if that's given; where mustn't restrict the token or the
+    clustering columns. The columns given (or any other selectors) are
+    used as they are, so they must already be quoted where necessary, and
+    so must the key column names. The primary key columns are selected
+    after them, for continuing the last partition, and left out of the
+    rows handed back. decoder is the cql decoder class for the values;
+    with SerializedValueDecoder, the values skip the decoder altogether.
+    Otherwise fetch_rows, if given, is called with the cursor to decode its
+    rows instead of fetchall(). The column_types, description and
+    name_info of the rows are available once the first row has been read.
+    """
+
+    def __init__(self, cursor, ksname, cfname, columns, partition_key, clustering_key,
+                 key_types, descending, page_size, start_token=None, end_token=None,
+                 decoder=None, where=None, fetch_rows=None):
+        self.cursor = cursor
+        self.ksname = ksname
+        self.cfname = cfname
+        self.columns = columns
+        self.partition_key = partition_key
+        self.clustering_key = clustering_key
+        self.key_types = key_types
+        self.descending = descending
+        self.token_expr = 'token(%s)' % ', '.join(partition_key)
+        self.select = 'SELECT %s, %s, %s FROM %s.%s' % (', '.join(columns),
+                                                        ', '.join(partition_key + clustering_key),
+                                                        self.token_expr, ksname, cfname)
+        self.page_size = page_size
+        self.start_token = start_token
+        self.end_token = end_token
+        self.decoder = decoder
+        self.where = where
+        self.serialized = decoder is not None and issubclass(decoder, SerializedValueDecoder)
+        if self.serialized:
+            fetch_rows = serialized_rows
+        elif fetch_rows is None:
+            fetch_rows = lambda cursor: cursor.fetchall()
+        self.fetch_rows = fetch_rows
+        self.extra_columns = len(partition_key) + len(clustering_key) + 1
+        self.last_key = None
+        self.last_token = None
+        self.column_types = None
+        self.description = None
+        self.name_info = None
+
+    @classmethod
+    def from_layout(cls, cursor, layout, columns, page_size, protect_name, **kwargs):
+        ksname, cfname, partition_key, clustering_key, key_types, descending = \
+                key_info(layout, protect_name)
+        return cls(cursor, ksname, cfname, columns, partition_key, clustering_key, key_types,
+                   descending, page_size, **kwargs)
+
+    def fetch(self, conditions, limit):
+        query = self.select
+        if self.where is not None:
+            conditions = [self.where] + conditions
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        self.cursor.execute('%s LIMIT %d' % (query, limit), decoder=self.decoder)
+        rows = self.fetch_rows(self.cursor)
+        if not rows:
+            return rows
+        extra = self.extra_columns
+        if self.column_types is None:
+            self.column_types = self.cursor.column_types[:-extra]
+            self.description = self.cursor.description[:-extra]
+            self.name_info = self.cursor.name_info[:-extra]
+        self.last_key = self.cursor.columnvalues(self.cursor.result[-1])[-extra:-1]
+        self.last_token = rows[-1][-1]
+        if self.serialized:
+            self.last_token = self.cursor.column_types[-1].from_binary(self.last_token)
+        return [row[:-extra] for row in rows]
+
+    def rest_of_partition(self):
+        """
+        Return a KeyContinuation reading on from last_key to the end of its
+        partition.
+        """
+
+        partition = map(blob_literal, self.key_types, self.last_key)[:len(self.partition_key)]
+        where = ['%s = %s' % pair for pair in zip(self.partition_key, partition)]
+        if self.where is not None:
+            where.insert(0, self.where)
+        rest = KeyContinuation(self.cursor, self.ksname, self.cfname, self.columns,
+                               self.partition_key, self.clustering_key, self.key_types,
+                               self.descending, self.decoder, ' AND '.join(where),
+                               single_partition=True, fetch_rows=self.fetch_rows,
+                               page_size=self.page_size)
+        rest.last_key = self.last_key
+        return rest
+
+    def pages(self):
+        """
+        Generate the rows in lists of up to about page_size of them.
+        """
+
+        start = self.start_token
+        while True:
+            conditions = []
+            if start is not None:
+                conditions.append('%s > %s' % (self.token_expr, token_literal(start)))
+            if self.end_token is not None:
+                conditions.append('%s <= %s' % (self.token_expr, token_literal(self.end_token)))
+            page = self.fetch(conditions, self.page_size)
+            if page:
+                yield page
+            if len(page) < self.page_size:
+                return
+            start = self.last_token
+            if self.clustering_key:
+                for page in self.rest_of_partition().pages():
+                    yield page
+
+    def __iter__(self):
+        for page in self.pages():
+            for row in page:
+                yield row
+
+class KeyContinuation(object):
+    """
+    Reads the rows of a SELECT over a table a chunk at a time, each chunk
+    picking up after the primary key of the last row of the chunk before:
+    first through the rest of its partition, letting go of one clustering
+    column at a time from the last, then on to the partitions with later
+    tokens. The primary key columns are selected after the SELECT's own
+    selectors for that, and left out of the rows handed back.
+
+    where, if given, holds the SELECT's own relations. Those mustn't
+    restrict the token or the clustering columns, which is what the
+    continuation does. With single_partition, where picks out a single
+    partition, so there's nothing to read past the end of it. The selectors
+    and where are used as they are, so they must already be quoted where
+    necessary, and so must the key column names. fetch_rows is called with
+    the cursor to decode its rows, as for TokenPager; the key values are
+    taken as Cassandra sent them. page_size is the size of the chunks
+    pages() reads. execute, if given, is called in place of cursor.execute
+    to run each query.
+    """
+
+    def __init__(self, cursor, ksname, cfname, selectors, partition_key, clustering_key,
+                 key_types, descending, decoder=None, where=None, single_partition=False,
+                 fetch_rows=None, page_size=None, execute=None):
+        self.cursor = cursor
+        self.execute = execute if execute is not None else cursor.execute
+        self.select = 'SELECT %s, %s FROM %s.%s' % (', '.join(selectors),
+                                                    ', '.join(partition_key + clustering_key),
+                                                    ksname, cfname)
+        self.partition_key = partition_key
+        self.clustering_key = clustering_key
+        self.key_types = key_types
+        self.descending = descending
+        self.decoder = decoder
+        self.where = where
+        self.single_partition = single_partition
+        self.page_size = page_size
+        if fetch_rows is None:
+            fetch_rows = lambda cursor: cursor.fetchall()
+        self.fetch_rows = fetch_rows
+        self.key_size = len(partition_key) + len(clustering_key)
+        self.last_key = None
+        self.rows_read = 0
+        self.exhausted = False
+        self.column_types = None
+        self.description = None
+        self.name_info = None
+
+    @classmethod
+    def from_layout(cls, cursor, layout, selectors, protect_name, **kwargs):
+        ksname, cfname, partition_key, clustering_key, key_types, descending = \
+                key_info(layout, protect_name)
+        return cls(cursor, ksname, cfname, selectors, partition_key, clustering_key, key_types,
+                   descending, **kwargs)
+
+    def fetch(self, conditions, limit):
+        query = self.select
+        if self.where is not None:
+            conditions = [self.where] + conditions
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        self.execute('%s LIMIT %d' % (query, limit), decoder=self.decoder)
+        rows = self.fetch_rows(self.cursor)
+        if not rows:
+            return rows
+        if self.column_types is None:
+            self.column_types = self.cursor.column_types[:-self.key_size]
+            self.description = self.cursor.description[:-self.key_size]
+            self.name_info = self.cursor.name_info[:-self.key_size]
+        self.last_key = self.cursor.columnvalues(self.cursor.result[-1])[-self.key_size:]
+        return [row[:-self.key_size] for row in rows]
+
+    def continuations(self):
+        """
+        Generate the lists of relations picking out the rows after last_key,
+        in the order they come back in.
+        """
+
+        literals = map(blob_literal, self.key_types, self.last_key)
+        partition = literals[:len(self.partition_key)]
+        clustering = zip(self.clustering_key, literals[len(self.partition_key):],
+                         self.descending)
+        if self.single_partition:
+            same_partition = []
+        else:
+            same_partition = ['%s = %s' % pair for pair in zip(self.partition_key, partition)]
+        for num in range(len(clustering) - 1, -1, -1):
+            name, literal, desc = clustering[num]
+            yield same_partition \
+                  + ['%s = %s' % (prefix, value) for (prefix, value, _) in clustering[:num]] \
+                  + ['%s %s %s' % (name, '<' if desc else '>', literal)]
+        if not self.single_partition:
+            yield ['token(%s) > token(%s)' % (', '.join(self.partition_key),
+                                              ', '.join(partition))]
+
+    def next_chunk(self, limit):
+        """
+        Read up to limit more rows. Once fewer than that come back, there
+        are no more, and exhausted is set. If a query fails, the
+        continuation is left where it was.
+        """
+
+        last_key = self.last_key
+        try:
+            if last_key is None:
+                rows = self.fetch([], limit)
+            else:
+                rows = []
+                for conditions in self.continuations():
+                    rows.extend(self.fetch(conditions, limit - len(rows)))
+                    if len(rows) >= limit:
+                        break
+        except Exception:
+            self.last_key = last_key
+            raise
+        self.rows_read += len(rows)
+        self.exhausted = len(rows) < limit
+        return rows
+
+    def pages(self):
+        """
+        Generate the rest of the rows in lists of up to page_size of them.
+        """
+
+        while not self.exhausted:
+            page = self.next_chunk(self.page_size)
+            if page:
+                yield page
+
+def batch_statement(queries):
+    if len(queries) == 1:
+        return queries[0]
+    return 'BEGIN UNLOGGED BATCH\n  %s;\nAPPLY BATCH' % ';\n  '.join(queries)
+
+def partition_key_indexes_for(layout, columns):
+    """
+    The positions of the partition key columns in columns, or None if they
+    aren't all there.
+    """
+
+    if set(layout.partition_key_columns) <= set(columns):
+        return [columns.index(name) for name in layout.partition_key_columns]
+    return None
+
+# How many prepared import statements to keep at most. There is one for
+# each combination of null fields and batch size in use.
+MAX_PREPARED_STATEMENTS = 100
+
+class StatementCache(object):
+    """
+    The statements prepared for import, by key, dropping the least recently
+    used one once there are more than max_size of them.
+
+    >>> cache = StatementCache(2)
+    >>> cache['a'] = 1; cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3
+    >>> cache.get('b') is None, cache.get('a'), len(cache)
+    (True, 1, 2)
+    """
+
+    def __init__(self, max_size=MAX_PREPARED_STATEMENTS):
+        self.max_size = max_size
+        self.statements = OrderedDict()
+
+    def __len__(self):
+        return len(self.statements)
+
+    def get(self, key):
+        statement = self.statements.pop(key, None)
+        if statement is not None:
+            self.statements[key] = statement
+        return statement
+
+    def __setitem__(self, key, statement):
+        self.statements.pop(key, None)
+        self.statements[key] = statement
+        if len(self.statements) > self.max_size:
+            self.statements.popitem(last=False)
+
+    def clear(self):
+        self.statements.clear()
+
+class ImportConverter(object):
+    """
+    Turns CSV records for one table into bindings for a prepared INSERT.
+
+    Fields equal to the null string can't be bound through the Thrift
+    interface, so they are written as literals in the statement text
+    instead. One statement is prepared for each distinct combination of
+    null fields.
+
+    Batches of rows are bound the same way, one INSERT per row. The rows of
+    a batch must all have the same null fields, as group_into_batches()
+    ensures when given our nullmask(), and the statements are keyed by
+    their null mask and number of rows. The statements prepared for the
+    most recently used keys are kept in prepared.
+    """
+
+    def __init__(self, ksname, cfname, columns, coltypes, null_literals, nullval,
+                 partition_key_indexes=None):
+        self.ksname = ksname
+        self.cfname = cfname
+        self.columns = columns
+        self.nullval = nullval
+        self.null_literals = null_literals
+        self.coltypes = coltypes
+        self.converters = [_converters[t.typename] for t in coltypes]
+        self.serializers = [value_serializer(t) for t in coltypes]
+        self.partition_key_indexes = partition_key_indexes
+        self.paramnames = []
+        self.prepared = StatementCache()
+
+    @classmethod
+    def from_layout(cls, layout, columns, nullval, protect_name):
+        """
+        Build a converter for the given columns of a CqlTableDef, or return
+        None if some column has a type which can't be converted client-side.
+        """
+        coltypes = []
+        null_literals = []
+        for name in columns:
+            cqltype = column_type(layout, name)
+            if cqltype.typename not in _converters:
+                return None
+            coltypes.append(cqltype)
+            null_literals.append(null_literal(layout, name, cqltype))
+        return cls(protect_name(layout.keyspace_name), protect_name(layout.columnfamily_name),
+                   map(protect_name, columns), coltypes, null_literals, nullval,
+                   partition_key_indexes_for(layout, columns))
+
+    def adapt_prepared(self, prepared):
+        """
+        Return what to execute in place of the PreparedQuery for one of our
+        statements. Its encode_params() gets the params from convert_rows().
+        """
+
+        return ConvertedParamsQuery(prepared)
+
+    def paramnames_for(self, rowindex):
+        while len(self.paramnames) <= rowindex:
+            self.paramnames.append(['r%dv%d' % (len(self.paramnames), n)
+                                    for n in range(len(self.columns))])
+        return self.paramnames[rowindex]
+
+    def nullmask(self, row):
+        """
+        Which fields of the given CSV record are null, as a tuple of bools.
+        """
+        nullval = self.nullval
+        return tuple([value == nullval for value in row])
+
+    def convert_row(self, row):
+        """
+        Return a (nullmask, values) pair for the given CSV record, with None
+        in values wherever the field is null. Raises one of
+        CONVERSION_ERRORS if some field can't be read as its column's type.
+        """
+        nullmask = self.nullmask(row)
+        values = [None if isnull else convert(value) for (convert, isnull, value)
+                  in zip(self.converters, nullmask, row)]
+        return nullmask, values
+
+    def convert_rows(self, rows):
+        """
+        Return the statement key and the params binding it for a batch of
+        CSV records. Raises ValueError if the records don't all have the
+        same null fields.
+        """
+        first_nullmask = None
+        params = {}
+        for rowindex, row in enumerate(rows):
+            nullmask, values = self.convert_row(row)
+            if first_nullmask is None:
+                first_nullmask = nullmask
+            elif nullmask != first_nullmask:
+                raise ValueError('records in a batch have different null fields')
+            for pname, isnull, value in zip(self.paramnames_for(rowindex), nullmask, values):
+                if not isnull:
+                    params[pname] = value
+        return (first_nullmask, len(rows)), params
+
+    def routing_key(self, row):
+        """
+        Return the serialized partition key of a CSV record, as hashed by the
+        partitioner. Raises one of CONVERSION_ERRORS if it can't be read.
+        """
+        parts = [self.serialize_key_part(n, row[n]) for n in self.partition_key_indexes]
+        if len(parts) == 1:
+            return parts[0]
+        # composite partition keys are hashed in CompositeType's format
+        return ''.join(struct.pack('>H', len(part)) + part + '\x00' for part in parts)
+
+    def serialize_key_part(self, index, value):
+        if value == self.nullval:
+            raise ValueError('null value in partition key')
+        return self.serializers[index](self.converters[index](value))
+
+    def query_for(self, key):
+        nullmask, count = key
+        inserts = []
+        for rowindex in range(count):
+            values = [lit if isnull else ':' + pname for (pname, lit, isnull)
+                      in zip(self.paramnames_for(rowindex), self.null_literals, nullmask)]
+            inserts.append('INSERT INTO %s.%s (%s) VALUES (%s)' % (
+                self.ksname, self.cfname, ', '.join(self.columns), ', '.join(values)))
+        return batch_statement(inserts)
+
+class SerializedParamsQuery(object):
+    """
+    Stands in for a PreparedQuery whose params are already serialized, and
+    only need putting in order.
+    """
+
+    def __init__(self, prepared):
+        self.querytext = prepared.querytext
+        self.itemid = prepared.itemid
+        self.paramnames = prepared.paramnames
+
+    def encode_params(self, params):
+        return [params[name] for name in self.paramnames]
+
+class ConvertedParamsQuery(SerializedParamsQuery):
+    """
+    Stands in for a PreparedQuery whose params come from the converters
+    above, serializing each with the serializer matching its converter.
+    """
+
+    def __init__(self, prepared):
+        SerializedParamsQuery.__init__(self, prepared)
+        self.serializers = map(value_serializer, prepared.vartypes)
+
+    def encode_params(self, params):
+        return [serialize(params[name]) for (name, serialize)
+                in zip(self.paramnames, self.serializers)]
+
+class EncodedParamsQuery(SerializedParamsQuery):
+    """
+    Stands in for a PreparedQuery whose params have already been through
+    its encode_params(), so that serialization errors can be caught apart
+    from failures to execute the query.
+    """
+
+    def encode_params(self, params):
+        return params
+
+class BinaryImportConverter(ImportConverter):
+    """
+    Binds records read from a binary dump. Their fields are the values
+    exactly as Cassandra serialized them, or None for nulls, so they are
+    bound without any conversion, whatever the column types.
+    """
+
+    def __init__(self, ksname, cfname, columns, null_literals, partition_key_indexes=None):
+        ImportConverter.__init__(self, ksname, cfname, columns, (), null_literals, None,
+                                 partition_key_indexes)
+
+    @classmethod
+    def from_layout(cls, layout, columns, nullval, protect_name):
+        """
+        Build a converter for the given columns of a CqlTableDef. nullval is
+        ignored; nulls are marked as such in the dump.
+        """
+        null_literals = [null_literal(layout, name, column_type(layout, name))
+                         for name in columns]
+        return cls(protect_name(layout.keyspace_name), protect_name(layout.columnfamily_name),
+                   map(protect_name, columns), null_literals,
+                   partition_key_indexes_for(layout, columns))
+
+    def adapt_prepared(self, prepared):
+        return SerializedParamsQuery(prepared)
+
+    def nullmask(self, row):
+        return tuple([value is None for value in row])
+
+    def convert_row(self, row):
+        return self.nullmask(row), row
+
+    def serialize_key_part(self, index, value):
+        if value is None:
+            raise ValueError('null value in partition key')
+        return value
+
+# Types whose values must be quoted to be read as CQL literals; the fields
+# of all other columns are passed through as they are.
+QUOTED_LITERAL_TYPES = ('ascii', 'text', 'timestamp', 'inet')
+
+class LiteralConverter(object):
+    """
+    Turns CSV records for one table into INSERT statements with the fields
+    as CQL literals, for PREPAREDSTATEMENTS=false, for tables with types
+    ImportConverter can't read, and for rows it rejects. Values are left
+    intact for Cassandra to interpret.
+
+    All the per-column work (finding the column's type, deciding how to
+    quote it and what its null looks like, quoting the names) is done once
+    up front; each field then only goes through its column's formatter.
+    """
+
+    def __init__(self, ksname, cfname, columns, formatters):
+        self.insert_prefix = 'INSERT INTO %s.%s (%s) VALUES (' % (ksname, cfname,
+                                                                  ', '.join(columns))
+        self.formatters = formatters
+
+    @staticmethod
+    def make_formatter(nullval, null_literal, quote=None):
+        if quote is None:
+            return lambda value: null_literal if value == nullval else value
+        return lambda value: null_literal if value == nullval else quote(value)
+
+    @classmethod
+    def from_layout(cls, layout, columns, nullval, protect_name, protect_value):
+        formatters = []
+        for name in columns:
+            cqltype = column_type(layout, name)
+            quote = None
+            if cqltype.cql_parameterized_type() in QUOTED_LITERAL_TYPES:
+                quote = protect_value
+            formatters.append(cls.make_formatter(nullval, null_literal(layout, name, cqltype),
+                                                 quote))
+        return cls(protect_name(layout.keyspace_name), protect_name(layout.columnfamily_name),
+                   map(protect_name, columns), formatters)
+
+    def insert_for(self, row):
+        return self.insert_prefix + ', '.join([fmt(value) for (fmt, value)
+                                               in zip(self.formatters, row)]) + ')'
+
+    def query_for(self, rows):
+        return batch_statement(map(self.insert_for, rows))
+
+class ImportErrorHandler(object):
+    """
+    Decides what happens to rows which fail to import. Failures which may
+    be transient (timeouts, unavailable or overloaded nodes) are retried,
+    up to max_attempts tries in all, with exponentially growing pauses in
+    between. Rows which still fail are handed to on_reject(batch, message)
+    and skipped, until more than max_errors rows have been rejected (any
+    number, if max_errors is negative), at which point the import stops.
+    """
+
+    retry_delay_base = 0.5
+
+    def __init__(self, max_errors=0, max_attempts=1, on_reject=None):
+        self.max_errors = max_errors
+        self.max_attempts = max_attempts
+        self.on_reject = on_reject
+        self.rejected = 0
+
+    def retry_delay(self, attempt):
+        return self.retry_delay_base * 2 ** (attempt - 1)
+
+    def reject(self, batch, message):
+        """
+        Returns whether the import can carry on without these records.
+        """
+        if 0 <= self.max_errors < self.rejected + len(batch):
+            return False
+        self.rejected += len(batch)
+        if self.on_reject is not None:
+            self.on_reject(batch, message)
+        return True
+
+class RateLimiter(object):
+    """
+    Token bucket letting through rate rows per second on average, in bursts
+    of up to a second's worth. A batch bigger than that goes through once
+    the bucket is full, and the ones after it wait for the debt to clear.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self.last_fill = time.time()
+
+    def acquire(self, count):
+        while True:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_fill) * self.rate)
+            self.last_fill = now
+            if self.tokens >= min(count, self.capacity):
+                self.tokens -= count
+                return
+            time.sleep((min(count, self.capacity) - self.tokens) / self.rate)
+
+def format_bytes(count):
+    """
+    >>> format_bytes(123)
+    '123B'
+    >>> format_bytes(3 * 1024 * 1024 + 300 * 1024)
+    '3.3MB'
+    """
+
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            break
+        count /= 1024.0
+    return ('%d%s' if unit == 'B' else '%.1f%s') % (count, unit)
+
+def format_eta(seconds):
+    """
+    >>> format_eta(3725.2)
+    '1:02:05'
+    """
+
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    return '%d:%02d:%02d' % (minutes // 60, minutes % 60, seconds)
+
+class ProgressReporter(object):
+    """
+    Keeps a one-line summary of how a COPY is going up to date on out,
+    redrawing it at most every interval seconds as update() is called with
+    the number of rows just done. Rates are averaged over the last window
+    seconds.
+
+    The other figures are sampled from callables, any of which may be None:
+    position() gives the bytes read or written so far, in_flight() the
+    requests outstanding and errors() the rows given up on. When total_bytes
+    is known, an ETA is worked out from how fast position() advances.
+    """
+
+    interval = 0.5
+    window = 5.0
+
+    def __init__(self, verb, total_bytes=None, position=None, in_flight=None, errors=None,
+                 out=sys.stderr):
+        self.verb = verb
+        self.total_bytes = total_bytes
+        self.position = position
+        self.in_flight = in_flight
+        self.errors = errors
+        self.out = out
+        self.rows = 0
+        self.samples = deque([(time.time(), 0, 0)])
+        self.next_report = self.samples[0][0] + self.interval
+        self.width = 0
+
+    def update(self, rows=0):
+        self.rows += rows
+        now = time.time()
+        if now >= self.next_report:
+            self.next_report = now + self.interval
+            self.report(now)
+
+    def describe(self, now):
+        position = self.position() if self.position is not None else 0
+        self.samples.append((now, self.rows, position))
+        while len(self.samples) > 2 and self.samples[1][0] <= now - self.window:
+            self.samples.popleft()
+        then, rows_then, position_then = self.samples[0]
+        elapsed = max(now - then, 1e-6)
+        parts = ['%s %d rows' % (self.verb, self.rows),
+                 '%.0f rows/s' % ((self.rows - rows_then) / elapsed)]
+        if self.position is not None:
+            if self.total_bytes:
+                parts.append('%s of %s' % (format_bytes(position), format_bytes(self.total_bytes)))
+            else:
+                parts.append(format_bytes(position))
+        if self.in_flight is not None:
+            parts.append('%d in flight' % self.in_flight())
+        if self.errors is not None:
+            parts.append('%d errors' % self.errors())
+        if self.total_bytes and position > position_then:
+            byte_rate = (position - position_then) / elapsed
+            parts.append('ETA %s' % format_eta(max(0, self.total_bytes - position) / byte_rate))
+        return ', '.join(parts)
+
+    def report(self, now=None):
+        line = self.describe(now or time.time())
+        self.out.write('\r' + line.ljust(self.width))
+        self.out.flush()
+        self.width = len(line)
+
+    def finish(self):
+        """
+        Take the progress line off the screen.
+        """
+
+        if self.width:
+            self.out.write('\r' + ' ' * self.width + '\r')
+            self.out.flush()
+            self.width = 0
+
+class AdaptiveWindow(object):
+    """
+    Number of requests to keep outstanding, managed the way TCP manages its
+    congestion window: it grows by one for each window's worth of
+    successful requests, up to maximum, and is halved (down to one) when
+    the cluster signals it is overloaded. Further signals are ignored until
+    the requests sent before the last cut have had time to come back.
+    """
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.size = 1.0
+        self.since_cut = 0
+
+    def limit(self):
+        return int(self.size)
+
+    def succeeded(self):
+        self.since_cut += 1
+        self.size = min(self.maximum, self.size + 1.0 / self.size)
+
+    def overloaded(self):
+        if self.since_cut < self.size:
+            return
+        self.size = max(1.0, self.size / 2)
+        self.since_cut = 0
+
+# errors worth another try, from the Thrift and native interfaces respectively.
+# IntegrityError is what a schema disagreement becomes.
+RETRYABLE_ERRORS = (cql.OperationalError, cql.IntegrityError)
+RETRYABLE_ERROR_MESSAGES = (UnavailableExceptionErrorMessage, OverloadedErrorMessage,
+                            IsBootstrappingErrorMessage, RequestTimeoutException)
+
+# the native protocol error for an EXECUTE of a statement the node doesn't
+# have prepared (any more), which the driver has no message class for
+UNPREPARED_ERROR_CODE = 0x2500
+
+class Importer(object):
+    """
+    Common parts of the importers. Subclasses insert batches of records
+    with insert(batch), and call finished() or failed() for each. Batches
+    put off for later are sent by send_due() and waited for by flush().
+    """
+
+    # called with each batch of records once it is inserted or rejected
+    on_finished = None
+
+    # RateLimiter to pace the import, if any
+    rate_limiter = None
+
+    def __init__(self, group=None, errors=None):
+        self.group = group or (lambda records: ([record] for record in records))
+        self.errors = errors or ImportErrorHandler()
+        self.imported = 0
+        self.failures = []
+
+    def close(self):
+        pass
+
+    def requests_in_flight(self):
+        return 0
+
+    def send_due(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def finished(self, batch):
+        self.imported += len(batch)
+        if self.on_finished is not None:
+            self.on_finished(batch)
+
+    def failed(self, batch, message):
+        if len(batch) > 1:
+            # find out which of the rows are at fault
+            for record in batch:
+                if self.failures:
+                    break
+                self.insert([record])
+        elif self.errors.reject(batch, message):
+            if self.on_finished is not None:
+                self.on_finished(batch)
+        else:
+            rownum, linenum, _ = batch[0]
+            self.failures.append((rownum, linenum, message))
+
+    def import_records(self, records):
+        """
+        Insert (rownum, linenum, row) records until they run out or the
+        import has to stop. Returns the number of rows imported and the
+        lowest (rownum, linenum, message) failure, or None.
+        """
+        already_imported = self.imported
+        for batch in self.group(records):
+            if self.failures:
+                break
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(len(batch))
+            self.send_due()
+            self.insert(batch)
+        self.flush()
+        failure = min(self.failures) if self.failures else None
+        return self.imported - already_imported, failure
+
+class SynchronousImporter(Importer):
+    """
+    Inserts batches of rows one at a time through insert_rows(rows), a
+    callable raising a cql.Error if the rows can't be inserted. Rows with
+    values insert_rows() can't convert are rejected like any others:
+
+    >>> converter = ImportConverter('ks', 'cf', ['d', 'a'],
+    ...                             map(lookup_casstype, ['DecimalType', 'InetAddressType']),
+    ...                             ['null', 'null'], '')
+    >>> rejected = []
+    >>> errors = ImportErrorHandler(max_errors=-1,
+    ...                             on_reject=lambda batch, message: rejected.append(message))
+    >>> importer = SynchronousImporter(converter.convert_rows, errors=errors)
+    >>> importer.import_records([(1, 1, ['1.5', '10.0.0.1']), (2, 2, ['abc', '10.0.0.1']),
+    ...                          (3, 3, ['2.5', 'nowhere'])])
+    (1, None)
+    >>> for message in rejected:
+    ...     print message
+    Invalid value in record: 'abc' is not a decimal
+    Invalid value in record: 'nowhere' is not an IP address
+    """
+
+    def __init__(self, insert_rows, group=None, errors=None):
+        Importer.__init__(self, group, errors)
+        self.insert_rows = insert_rows
+
+    def insert(self, batch):
+        attempt = 1
+        while True:
+            try:
+                self.insert_rows([row for (_, _, row) in batch])
+            except RETRYABLE_ERRORS, e:
+                if attempt >= self.errors.max_attempts:
+                    return self.failed(batch, str(e))
+                time.sleep(self.errors.retry_delay(attempt))
+                attempt += 1
+            except cql.Error, e:
+                return self.failed(batch, str(e))
+            except CONVERSION_ERRORS, e:
+                return self.failed(batch, 'Invalid value in record: %s' % (e,))
+            else:
+                return self.finished(batch)
+
+class PipelinedImporter(Importer):
+    """
+    Inserts rows over a native protocol connection without waiting for each
+    response in turn. Up to max_in_flight EXECUTE requests are kept
+    outstanding, and responses are matched to their rows by stream id.
+
+    The connection's own request methods hand out ever-increasing stream
+    ids, so once the connection is set up, all traffic on it goes through
+    this object, which recycles a fixed set of ids instead.
+
+    Each request carries one batch of rows. Batches to be tried again wait
+    in a queue until they are due, so the other requests keep flowing.
+
+    If adaptive is set, max_in_flight is only an upper bound, and the number
+    of outstanding requests is adjusted by an AdaptiveWindow according to
+    how the cluster copes.
+
+    Rows the converter can't bind are sent as CQL literals made by the
+    LiteralConverter literals, if given, and otherwise rejected.
+    """
+
+    # stream ids are a single signed byte in version 1 of the protocol
+    max_stream_ids = 128
+
+    def __init__(self, conn, converter, max_in_flight, consistency_level='ONE', group=None,
+                 errors=None, adaptive=False, literals=None):
+        Importer.__init__(self, group, errors)
+        self.conn = conn
+        self.converter = converter
+        self.literals = literals
+        self.consistency_level = consistency_level
+        max_in_flight = min(max_in_flight, self.max_stream_ids)
+        self.window = AdaptiveWindow(max_in_flight) if adaptive else None
+        self.free_ids = range(max_in_flight)
+        self.in_flight = {}
+        self.prepared = StatementCache()
+        self.retries = []
+
+    def close(self):
+        self.conn.close()
+
+    def requests_in_flight(self):
+        return len(self.in_flight)
+
+    def send(self, msg, callback):
+        while not self.free_ids or (self.window is not None
+                                    and len(self.in_flight) >= self.window.limit()):
+            self.receive()
+        streamid = self.free_ids.pop()
+        msg.send(self.conn.socketf, streamid, compression=self.conn.compressor)
+        self.in_flight[streamid] = callback
+
+    def receive(self):
+        msg = read_frame(self.conn.socketf, decompressor=self.conn.decompressor)
+        if msg.stream_id < 0:
+            # server-initiated event; we never register for any
+            return
+        callback = self.in_flight.pop(msg.stream_id)
+        self.free_ids.append(msg.stream_id)
+        callback(msg)
+
+    def request(self, msg):
+        replies = []
+        self.send(msg, replies.append)
+        while not replies:
+            self.receive()
+        return replies[0]
+
+    def schedule(self, batch, attempt, delay=0):
+        heapq.heappush(self.retries, (time.time() + delay, batch[0][0], attempt, batch))
+
+    def send_due(self):
+        while self.retries and self.retries[0][0] <= time.time():
+            due, rownum, attempt, batch = heapq.heappop(self.retries)
+            self.insert(batch, attempt)
+
+    def flush(self):
+        while self.in_flight or self.retries:
+            self.send_due()
+            if self.in_flight:
+                self.receive()
+            elif self.retries:
+                time.sleep(max(0, self.retries[0][0] - time.time()))
+
+    def get_prepared(self, key):
+        prepared = self.prepared.get(key)
+        if prepared is None:
+            query = self.converter.query_for(key)
+            pquery, paramnames = prepare_query(query)
+            reply = self.request(PrepareMessage(query=pquery))
+            if isinstance(reply, ErrorMessage):
+                raise cql.ProgrammingError('Query preparation failed: %s' % reply.summarymsg())
+            queryid, colspecs = reply.results
+            prepared = self.converter.adapt_prepared(
+                    PreparedQuery(query, queryid, [spec[3] for spec in colspecs], paramnames))
+            self.prepared[key] = prepared
+        return prepared
+
+    def message_for(self, rows):
+        """
+        Return the request inserting rows: an EXECUTE of the prepared INSERT,
+        or, when some field can't be bound, a QUERY with the fields as CQL
+        literals for Cassandra to interpret.
+        """
+        try:
+            key, params = self.converter.convert_rows(rows)
+            prepared = self.get_prepared(key)
+            return ExecuteMessage(queryid=prepared.itemid,
+                                  queryparams=prepared.encode_params(params),
+                                  consistencylevel=self.consistency_level)
+        except CONVERSION_ERRORS:
+            if self.literals is None:
+                raise
+        return QueryMessage(query=self.literals.query_for(rows),
+                            consistencylevel=self.consistency_level)
+
+    def insert(self, batch, attempt=1):
+        try:
+            msg = self.message_for([row for (_, _, row) in batch])
+        except CONVERSION_ERRORS, e:
+            return self.failed(batch, 'Invalid value in record: %s' % (e,))
+
+        def inserted(reply):
+            if self.window is not None:
+                if isinstance(reply, RETRYABLE_ERROR_MESSAGES):
+                    self.window.overloaded()
+                elif not isinstance(reply, ErrorMessage):
+                    self.window.succeeded()
+            if not isinstance(reply, ErrorMessage):
+                self.finished(batch)
+            elif reply.code == UNPREPARED_ERROR_CODE and attempt < self.errors.max_attempts:
+                # the node has dropped our statements from its cache
+                self.prepared.clear()
+                self.schedule(batch, attempt + 1)
+            elif isinstance(reply, RETRYABLE_ERROR_MESSAGES) \
+                    and attempt < self.errors.max_attempts:
+                self.schedule(batch, attempt + 1, self.errors.retry_delay(attempt))
+            elif len(batch) > 1:
+                # this runs from inside receive(), so leave it to send_due()
+                # to split up the batch
+                for record in batch:
+                    self.schedule([record], 1)
+            else:
+                self.failed(batch, reply.summarymsg())
+
+        self.send(msg, inserted)
+
+class TokenAwareImporter(object):
+    """
+    Sends each batch of rows straight to a replica of its partition, saving
+    the hop through a coordinator. Hosts are connected to as they are first
+    needed, each through a PipelinedImporter got from open_importer(host),
+    which returns None if the host can't be reached. Batches with no usable
+    replica go through the default importer.
+    """
+
+    # called with each batch of records once it is inserted or rejected
+    on_finished = None
+
+    # RateLimiter to pace the import, if any
+    rate_limiter = None
+
+    def __init__(self, default, converter, token_for, token_map, open_importer, group=None):
+        self.default = default
+        self.converter = converter
+        self.token_for = token_for
+        self.token_map = token_map
+        self.open_importer = open_importer
+        self.group = group or (lambda records: ([record] for record in records))
+        self.importers = {}
+
+    def all_importers(self):
+        return [self.default] + [imp for imp in self.importers.values() if imp is not None]
+
+    def close(self):
+        for importer in self.all_importers():
+            importer.close()
+
+    def requests_in_flight(self):
+        return sum(imp.requests_in_flight() for imp in self.all_importers())
+
+    def importer_for(self, batch):
+        try:
+            token = self.token_for(self.converter.routing_key(batch[0][2]))
+        except CONVERSION_ERRORS:
+            # the default importer will report the bad value
+            return self.default
+        for host in self.token_map.replicas_for(token):
+            if host not in self.importers:
+                importer = self.importers[host] = self.open_importer(host)
+                if importer is not None:
+                    importer.on_finished = self.on_finished
+            if self.importers[host] is not None:
+                return self.importers[host]
+        return self.default
+
+    def import_records(self, records):
+        """
+        Same as PipelinedImporter.import_records, sending each batch to the
+        importer for its replicas.
+        """
+        for importer in self.all_importers():
+            importer.on_finished = self.on_finished
+        already_imported = sum(imp.imported for imp in self.all_importers())
+        for batch in self.group(records):
+            if any(imp.failures for imp in self.all_importers()):
+                break
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(len(batch))
+            for importer in self.all_importers():
+                importer.send_due()
+            self.importer_for(batch).insert(batch)
+        failures = []
+        for importer in self.all_importers():
+            importer.flush()
+            failures.extend(importer.failures)
+        imported = sum(imp.imported for imp in self.all_importers()) - already_imported
+        return imported, (min(failures) if failures else None)
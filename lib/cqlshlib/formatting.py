@@ -17,8 +17,9 @@
 import re
 import time
 import binascii
+import heapq
 import math
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from . import wcwidth
 from .displaying import colorme, FormattedValue, DEFAULT_VALUE_COLORS
 from cql import cqltypes
@@ -51,7 +52,14 @@ default_colormap = DEFAULT_VALUE_COLORS
 empty_colormap = defaultdict(lambda: '')
 
 def format_by_type(cqltype, val, encoding, colormap=None, addcolor=False,
-                   nullval=None, time_format=None, float_precision=None):
+                   nullval=None, time_format=None, float_precision=None, max_width=None):
+    """
+    Format val, a value of cqltype. With max_width, values wider than that
+    are cut down to fit it, ending in TRUNCATION_MARKER, and long strings,
+    blobs and collections only have the part of them that can show
+    formatted at all.
+    """
+
     if nullval is None:
         nullval = default_null_placeholder
     if val is None:
@@ -64,9 +72,126 @@ def format_by_type(cqltype, val, encoding, colormap=None, addcolor=False,
         time_format = default_time_format
     if float_precision is None:
         float_precision = default_float_precision
-    return format_value(cqltype, val, encoding=encoding, colormap=colormap,
-                        time_format=time_format, float_precision=float_precision,
-                        nullval=nullval)
+    truncated = False
+    if max_width is not None:
+        val, truncated = value_prefix(cqltype, val, max_width)
+    formatted = format_value(cqltype, val, encoding=encoding, colormap=colormap,
+                             time_format=time_format, float_precision=float_precision,
+                             nullval=nullval)
+    if truncated or (max_width is not None and formatted.displaywidth > max_width):
+        return truncate_formatted(formatted, max_width, encoding, colormap,
+                                  _color_keys.get(cqltype.typename, 'default'))
+    return formatted
+
+def formatter_for_type(cqltype, encoding, colormap=None, addcolor=False,
+                       nullval=None, time_format=None, float_precision=None):
+    """
+    Return a function formatting values of cqltype just like format_by_type
+    does with the same arguments, but with the formatter already looked up
+    and its arguments already settled, for formatting lots of values of
+    one column.
+    """
+
+    if nullval is None:
+        nullval = default_null_placeholder
+    null = colorme(nullval, colormap, 'error')
+    if addcolor is False:
+        colormap = empty_colormap
+    elif colormap is None:
+        colormap = default_colormap
+    if time_format is None:
+        time_format = default_time_format
+    if float_precision is None:
+        float_precision = default_float_precision
+    kwargs = dict(encoding=encoding, colormap=colormap, time_format=time_format,
+                  float_precision=float_precision, nullval=nullval)
+    formatter = _formatters.get(cqltype.typename, format_value_default)
+    subtypes = cqltype.subtypes
+    empty_ok = cqltype.empty_binary_ok
+
+    def format_one(val):
+        if val is None:
+            return null
+        if val == '' and not empty_ok:
+            return format_value_default(val, **kwargs)
+        return formatter(val, subtypes=subtypes, **kwargs)
+    return format_one
+
+TRUNCATION_MARKER = '...'
+
+# the colors values of each type are formatted in, for coloring the cut
+# down versions of them
+_color_keys = {
+    'text': 'text', 'varchar': 'text', 'ascii': 'text', 'blob': 'blob',
+    'list': 'collection', 'set': 'collection', 'map': 'collection',
+    'uuid': 'uuid', 'timeuuid': 'uuid', 'timestamp': 'timestamp', 'inet': 'inet',
+    'int': 'int', 'bigint': 'int', 'varint': 'int', 'counter': 'int',
+    'float': 'float', 'double': 'float', 'decimal': 'decimal', 'boolean': 'boolean',
+}
+
+def value_prefix(cqltype, val, max_width):
+    """
+    Return as much of val as can show in max_width display columns once
+    formatted, and whether that's less than all of it. Only strings, blobs
+    and collections are cut short, since only those can get long enough to
+    matter: a character or byte formats to at least one column, and a
+    collection element to at least three, counting its separator.
+
+    >>> from cql.cqltypes import lookup_casstype
+    >>> value_prefix(lookup_casstype('UTF8Type'), u'abcdefgh', 4)
+    (u'abcd', True)
+    >>> value_prefix(lookup_casstype('SetType(Int32Type)'), set(range(10)), 4)
+    ([0, 1], True)
+    """
+
+    typename = cqltype.typename
+    if typename in ('text', 'varchar', 'ascii', 'blob'):
+        length = max_width
+    elif typename in ('list', 'set', 'map'):
+        length = max_width // 3 + 1
+    else:
+        return val, False
+    if len(val) <= length:
+        return val, False
+    if typename == 'set':
+        return heapq.nsmallest(length, val), True
+    if typename == 'map':
+        return OrderedDict(heapq.nsmallest(length, val.items())), True
+    return val[:length], True
+
+def truncate_formatted(formatted, max_width, encoding, colormap, colorkey):
+    """
+    Cut a FormattedValue down to max_width display columns, ending in
+    TRUNCATION_MARKER. The result is all in the color for colorkey, rather
+    than keeping the colors of the parts of the original.
+    """
+
+    room = max_width - len(TRUNCATION_MARKER)
+    chars = formatted.strval.decode(encoding)
+    width = end = 0
+    for char in chars:
+        charwidth = max(wcwidth.wcwidth(char), 0)
+        if width + charwidth > room:
+            break
+        width += charwidth
+        end += 1
+    bval = chars[:end].encode(encoding) + TRUNCATION_MARKER
+    return FormattedValue(bval, colormap[colorkey] + bval + colormap['reset'],
+                          width + len(TRUNCATION_MARKER))
+
+def fixed_width_for_type(cqltype, time_format=None):
+    """
+    The display width every non-null value of cqltype formats to, for the
+    types where that's known without looking at the values, or else None.
+    """
+
+    if cqltype.typename in ('uuid', 'timeuuid'):
+        return 36
+    if cqltype.typename == 'timestamp':
+        if time_format is None:
+            time_format = default_time_format
+        return format_value_timestamp(0, empty_colormap, time_format).displaywidth
+    return None
 
 def color_text(bval, colormap, displaywidth=None):
     # note that here, we render natural backslashes as just backslashes,
@@ -0,0 +1,203 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+from bisect import bisect_left
+from hashlib import md5
+
+_MASK64 = 0xffffffffffffffff
+
+def _rotl64(x, r):
+    return ((x << r) | (x >> (64 - r))) & _MASK64
+
+def _fmix64(k):
+    k ^= k >> 33
+    k = (k * 0xff51afd7ed558ccd) & _MASK64
+    k ^= k >> 33
+    k = (k * 0xc4ceb9fe1a85ec53) & _MASK64
+    k ^= k >> 33
+    return k
+
+def _signed_byte(c):
+    b = ord(c)
+    return b - 256 if b > 127 else b
+
+def murmur3_token(key):
+    """
+    The Murmur3Partitioner token for a serialized partition key: the first
+    half of its x64 128-bit MurmurHash3, as a signed long. Like Cassandra's
+    implementation, this sign-extends the bytes of the trailing block.
+
+    >>> murmur3_token('\\x00\\x00\\x00\\x01')
+    -4069959284402364209
+    """
+
+    c1 = 0x87c37b91114253d5
+    c2 = 0x4cf5ad432745937f
+    length = len(key)
+    nblocks = length // 16
+    h1 = h2 = 0
+
+    for block in range(nblocks):
+        k1, k2 = struct.unpack_from('<QQ', key, block * 16)
+        k1 = _rotl64((k1 * c1) & _MASK64, 31)
+        h1 ^= (k1 * c2) & _MASK64
+        h1 = (_rotl64(h1, 27) + h2) & _MASK64
+        h1 = (h1 * 5 + 0x52dce729) & _MASK64
+        k2 = _rotl64((k2 * c2) & _MASK64, 33)
+        h2 ^= (k2 * c1) & _MASK64
+        h2 = (_rotl64(h2, 31) + h1) & _MASK64
+        h2 = (h2 * 5 + 0x38495ab5) & _MASK64
+
+    tail = key[nblocks * 16:]
+    k1 = k2 = 0
+    for n in range(len(tail) - 1, 7, -1):
+        k2 ^= _signed_byte(tail[n]) << ((n - 8) * 8)
+    if len(tail) > 8:
+        k2 = _rotl64((k2 * c2) & _MASK64, 33)
+        h2 ^= (k2 * c1) & _MASK64
+    for n in range(min(len(tail), 8) - 1, -1, -1):
+        k1 ^= _signed_byte(tail[n]) << (n * 8)
+    if tail:
+        k1 = _rotl64((k1 * c1) & _MASK64, 31)
+        h1 ^= (k1 * c2) & _MASK64
+
+    h1 ^= length
+    h2 ^= length
+    h1 = (h1 + h2) & _MASK64
+    h2 = (h2 + h1) & _MASK64
+    h1 = _fmix64(h1)
+    h2 = _fmix64(h2)
+    h1 = (h1 + h2) & _MASK64
+
+    if h1 >= 1 << 63:
+        h1 -= 1 << 64
+    # Long.MIN_VALUE is reserved as the partitioner's minimum token
+    if h1 == -(1 << 63):
+        return (1 << 63) - 1
+    return int(h1)
+
+def md5_token(key):
+    """
+    The RandomPartitioner token for a serialized partition key: the absolute
+    value of its MD5 digest read as a signed big-endian integer.
+    """
+
+    token = int(md5(key).hexdigest(), 16)
+    if token >= 1 << 127:
+        token -= 1 << 128
+    return abs(token)
+
+_token_functions = {
+    'org.apache.cassandra.dht.Murmur3Partitioner': murmur3_token,
+    'org.apache.cassandra.dht.RandomPartitioner': md5_token,
+}
+
+# (minimum, maximum) tokens of the hashing partitioners. No key hashes to
+# the minimum token.
+_token_bounds = {
+    'org.apache.cassandra.dht.Murmur3Partitioner': (-(1 << 63), (1 << 63) - 1),
+    'org.apache.cassandra.dht.RandomPartitioner': (-1, 1 << 127),
+}
+
+def split_token_range(start, end, pieces, partitioner):
+    """
+    Split the ring range of tokens after start up to and including end into
+    pieces ranges of about the same size, as (start, end) pairs in ring
+    order. A range with start == end is the whole ring. Ranges wrapping
+    around past the maximum token are split in two there, so that each of
+    the results has start < end. Only the hashing partitioners are
+    supported.
+
+    >>> split_token_range(0, 100, 2, 'org.apache.cassandra.dht.Murmur3Partitioner')
+    [(0, 50), (50, 100)]
+    >>> split_token_range((1 << 63) - 10, -(1 << 63) + 10, 1,
+    ...                   'org.apache.cassandra.dht.Murmur3Partitioner')
+    [(9223372036854775798, 9223372036854775807), (-9223372036854775808, -9223372036854775798)]
+    """
+
+    minimum, maximum = _token_bounds[partitioner]
+    ringsize = maximum - minimum
+    size = (end - start) % ringsize or ringsize
+    bounds = [start + size * n // pieces for n in range(pieces + 1)]
+    ranges = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        if lower == upper:
+            continue
+        if lower >= maximum:
+            lower -= ringsize
+        if upper > maximum:
+            upper -= ringsize
+        if lower < upper:
+            ranges.append((int(lower), int(upper)))
+        else:
+            ranges.append((int(lower), int(maximum)))
+            if upper > minimum:
+                ranges.append((int(minimum), int(upper)))
+    return ranges
+
+def token_function(partitioner):
+    """
+    Return the function computing tokens for the named partitioner, or None
+    for the order-preserving ones, whose tokens aren't worth reproducing
+    client-side.
+    """
+
+    return _token_functions.get(partitioner)
+
+class TokenMap(object):
+    """
+    Maps tokens to the hosts holding replicas of them, as described by the
+    TokenRange list from a Thrift describe_ring call. Each range covers the
+    tokens after its start token up to and including its end token.
+    """
+
+    def __init__(self, end_tokens, replicas):
+        self.end_tokens = end_tokens
+        self.replicas = replicas
+
+    @classmethod
+    def from_ring(cls, ring):
+        ranges = []
+        for tokenrange in ring:
+            hosts = []
+            for endpoint, rpc_endpoint in zip(tokenrange.endpoints, tokenrange.rpc_endpoints
+                                              or tokenrange.endpoints):
+                hosts.append(endpoint if rpc_endpoint == '0.0.0.0' else rpc_endpoint)
+            ranges.append((int(tokenrange.end_token), tuple(hosts)))
+        ranges.sort()
+        return cls([end for (end, _) in ranges], [replicas for (_, replicas) in ranges])
+
+    def hosts(self):
+        return set(host for hosts in self.replicas for host in hosts)
+
+    def ranges(self):
+        """
+        Generate (start, end, replicas) for each range of the ring, in order.
+        The first one wraps around from the last end token.
+        """
+
+        starts = self.end_tokens[-1:] + self.end_tokens[:-1]
+        return zip(starts, self.end_tokens, self.replicas)
+
+    def replicas_for(self, token):
+        if not self.end_tokens:
+            return ()
+        index = bisect_left(self.end_tokens, token)
+        if index == len(self.end_tokens):
+            # past the last end token, so in the range wrapping around
+            index = 0
+        return self.replicas[index]
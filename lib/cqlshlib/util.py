@@ -14,6 +14,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import sys
+import time
+import threading
+import Queue
 from itertools import izip
 
 def split_list(items, pred):
@@ -77,3 +81,107 @@ def trim_if_present(s, prefix):
     if s.startswith(prefix):
         return s[len(prefix):]
     return s
+
+def prefetched(iterable):
+    """
+    Iterate over iterable, getting each item in a background thread while
+    the caller works on the one before, so that waiting on slow items (like
+    pages of query results) overlaps with using them. Only one item is
+    fetched ahead. Exceptions from iterable are raised in the caller.
+
+    When the caller stops early, the item being fetched is waited for, so
+    that nothing is still going on in the background afterwards.
+
+    >>> list(prefetched(iter([1, 2, 3])))
+    [1, 2, 3]
+    """
+
+    requests = Queue.Queue()
+    results = Queue.Queue()
+
+    def fetch():
+        iterator = iter(iterable)
+        while requests.get():
+            try:
+                results.put((True, iterator.next()))
+            except StopIteration:
+                results.put((False, None))
+                return
+            except Exception:
+                results.put((False, sys.exc_info()))
+                return
+
+    thread = threading.Thread(target=fetch)
+    thread.daemon = True
+    thread.start()
+    requests.put(True)
+    try:
+        while True:
+            # waiting with a timeout lets KeyboardInterrupt through
+            while True:
+                try:
+                    ok, item = results.get(timeout=1)
+                    break
+                except Queue.Empty:
+                    pass
+            if not ok:
+                if item is not None:
+                    raise item[0], item[1], item[2]
+                return
+            requests.put(True)
+            yield item
+    finally:
+        requests.put(False)
+        thread.join()
+
+class BufferedOutput(object):
+    """
+    Wraps a file written to a line at a time, collecting what's written
+    into chunks of about buffer_size bytes to pass on in one write each.
+    Whatever is held back goes through on flush(), or with the first write
+    max_delay seconds or more after the last time it went through, so
+    slowly arriving output still shows up. Other attributes are those of
+    the file.
+
+    >>> from StringIO import StringIO
+    >>> out = BufferedOutput(StringIO())
+    >>> out.write('a\\n'); out.write('b\\n'); out.getvalue()
+    ''
+    >>> out.flush(); out.getvalue()
+    'a\\nb\\n'
+    """
+
+    def __init__(self, out, buffer_size=64 * 1024, max_delay=0.5):
+        self.out = out
+        self.buffer_size = buffer_size
+        self.max_delay = max_delay
+        self.chunks = []
+        self.size = 0
+        self.last_flush = time.time()
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            # leave encoding it to the file, as if it were written directly
+            self.flush()
+            self.out.write(data)
+            return
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer_size or time.time() - self.last_flush >= self.max_delay:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            data = ''.join(self.chunks)
+            self.chunks = []
+            self.size = 0
+            self.out.write(data)
+        self.out.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self.out.close()
+
+    def __getattr__(self, name):
+        return getattr(self.out, name)